@@ -14,6 +14,49 @@ from math import log
 struct_block = struct.Struct('<I32s32sII4s')
 
 
+class LazyTXs:
+    """
+    tx list of a block read from database
+    only txhash is kept until txs are required (iter, index access..)
+    """
+    __slots__ = ("hashes", "loader", "_txs")
+
+    def __init__(self, hashes, loader):
+        self.hashes = tuple(hashes)
+        self.loader = loader  # loader(hashes) => [tx,..]
+        self._txs = None
+
+    def __repr__(self):
+        return "<LazyTXs {} {}>".format(len(self.hashes), 'loaded' if self._txs else 'not loaded')
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __reversed__(self):
+        return reversed(self.load())
+
+    def __getitem__(self, item):
+        return self.load()[item]
+
+    def __contains__(self, item):
+        return item.hash in self.hashes
+
+    def __reduce__(self):
+        # pickle as normal list
+        return list, (self.load(),)
+
+    def index(self, item):
+        return self.hashes.index(item.hash)
+
+    def load(self):
+        if self._txs is None:
+            self._txs = self.loader(self.hashes)
+        return self._txs
+
+
 class Block:
     __slots__ = (
         "b", "hash", "next_hash", "target_hash", "work_hash",
@@ -76,6 +119,17 @@ class Block:
         self.txs = list()
         self.create_time = int(time.time())
 
+    def copy(self):
+        # shallow copy, lazy txs are not shared
+        block = object.__new__(Block)
+        for name in Block.__slots__[:-1]:
+            setattr(block, name, getattr(self, name))
+        if isinstance(self.txs, LazyTXs):
+            block.txs = LazyTXs(hashes=self.txs.hashes, loader=self.txs.loader)
+        else:
+            block.txs = list(self.txs)
+        return block
+
     def serialize(self):
         self.b = struct_block.pack(
             self.version,
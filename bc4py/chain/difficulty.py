@@ -89,25 +89,21 @@ def get_bits_by_hash(previous_hash, consensus):
 
     # Loop through N most recent blocks.  "< height", not "<=".
     # height-1 = most recently solved rblock
-    target_hash = previous_hash
     timestamp = list()
     target = list()
     j = 0
-    while True:
-        target_block = builder.get_block(target_hash)
-        if target_block is None:
-            return MAX_BITS, MAX_TARGET
-        if target_block.flag != consensus:
-            target_hash = target_block.previous_hash
+    for height, blockhash, target_hash, block_time, bits, flag in builder.get_header_iter(previous_hash):
+        if flag != consensus:
             continue
         if j == N + 1:
             break
         j += 1
-        timestamp.insert(0, target_block.time)
-        target.insert(0, bits2target(target_block.bits))
-        target_hash = target_block.previous_hash
+        timestamp.insert(0, block_time)
+        target.insert(0, bits2target(bits))
         if target_hash == GENESIS_PREVIOUS_HASH:
             return MAX_BITS, MAX_TARGET
+    else:
+        return MAX_BITS, MAX_TARGET
 
     sum_target = t = j = 0
     for i in range(N):
@@ -144,20 +140,17 @@ def get_bias_by_hash(previous_hash, consensus):
 
     base_diffs = list()
     target_diffs = list()
-    target_hash = previous_hash
-    while True:
-        target_block = builder.get_block(target_hash)
-        if target_block is None:
-            return 1.0
-        target_hash = target_block.previous_hash
+    for height, blockhash, target_hash, block_time, bits, flag in builder.get_header_iter(previous_hash):
         if target_hash == GENESIS_PREVIOUS_HASH:
             return 1.0
-        elif target_block.flag == V.BLOCK_BASE_CONSENSUS and N > len(base_diffs):
-            base_diffs.append(bits2target(target_block.bits) * (N-len(base_diffs)))
-        elif target_block.flag == consensus and N > len(target_diffs):
-            target_diffs.append(bits2target(target_block.bits) * (N-len(target_diffs)))
+        elif flag == V.BLOCK_BASE_CONSENSUS and N > len(base_diffs):
+            base_diffs.append(bits2target(bits) * (N-len(base_diffs)))
+        elif flag == consensus and N > len(target_diffs):
+            target_diffs.append(bits2target(bits) * (N-len(target_diffs)))
         if len(base_diffs) >= N and len(target_diffs) >= N:
             break
+    else:
+        return 1.0
 
     bias = sum(base_diffs) / sum(target_diffs)
     cashe[(consensus, previous_hash)] = bias
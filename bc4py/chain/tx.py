@@ -72,6 +72,16 @@ class TX:
             self.serialize()
         self.signature = list()
 
+    def copy(self):
+        # shallow copy, lists are not shared
+        tx = object.__new__(TX)
+        for name in TX.__slots__[:-1]:
+            setattr(tx, name, getattr(self, name))
+        tx.inputs = list(self.inputs)
+        tx.outputs = list(self.outputs)
+        tx.signature = list(self.signature)
+        return tx
+
     def serialize(self):
         # 構造
         # [version I]-[type I]-[time I]-[deadline I]-[gas_price Q]-[gas_amount q]-[msg_type B]-
@@ -57,7 +57,7 @@ def bin2signature(b):
     # pk:32, sign:64
     r = list()
     for i in range(len(b) // 96):
-        r.append((hexlify(b[i*96:i*96+32]).decode(), b[i*96+32:i*96+96]))
+        r.append((hexlify(b[i*96:i*96+32]).decode(), bytes(b[i*96+32:i*96+96])))
     return r
 
 
@@ -0,0 +1,223 @@
+from bisect import bisect_left, bisect_right, insort
+import threading
+
+# key/value engines used by DataBase
+# all engines have same interface, stop key of iterator is included
+
+
+try:
+    import plyvel
+except ImportError:
+    plyvel = None
+try:
+    import leveldb
+except ImportError:
+    leveldb = None
+
+
+class Backend:
+    name = None
+
+    def get(self, k):
+        # return bytes or None
+        raise NotImplementedError
+
+    def iterator(self, start=None, stop=None):
+        # yield (key, value) of start <= key <= stop
+        raise NotImplementedError
+
+    def write(self, items, sync=False):
+        # write [(key, value),..] atomically, value None is delete
+        raise NotImplementedError
+
+    def snapshot(self):
+        # read only object with get/iterator/close
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PlyvelBackend(Backend):
+    name = 'plyvel'
+
+    def __init__(self, path, create_if_missing):
+        self.db = plyvel.DB(path, create_if_missing=create_if_missing)
+
+    def get(self, k):
+        b = self.db.get(k)
+        return None if b is None else bytes(b)
+
+    def iterator(self, start=None, stop=None):
+        return self.db.iterator(start=start, stop=stop, include_stop=True)
+
+    def write(self, items, sync=False):
+        batch = self.db.write_batch(sync=sync)
+        for k, v in items:
+            if v is None:
+                batch.delete(k)
+            else:
+                batch.put(k, v)
+        batch.write()
+
+    def snapshot(self):
+        return PlyvelSnapshot(self.db.snapshot())
+
+    def close(self):
+        self.db.close()
+
+
+class PlyvelSnapshot:
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def get(self, k):
+        b = self.snapshot.get(k)
+        return None if b is None else bytes(b)
+
+    def iterator(self, start=None, stop=None):
+        return self.snapshot.iterator(start=start, stop=stop, include_stop=True)
+
+    def close(self):
+        self.snapshot.close()
+
+
+class LevelDBBackend(Backend):
+    name = 'leveldb'
+
+    def __init__(self, path, create_if_missing):
+        self.db = leveldb.LevelDB(path, create_if_missing=create_if_missing)
+
+    def get(self, k):
+        try:
+            return bytes(self.db.Get(k))
+        except KeyError:
+            return None
+
+    def iterator(self, start=None, stop=None):
+        return self.db.RangeIter(key_from=start, key_to=stop)
+
+    def write(self, items, sync=False):
+        batch = leveldb.WriteBatch()
+        for k, v in items:
+            if v is None:
+                batch.Delete(k)
+            else:
+                batch.Put(k, v)
+        self.db.Write(batch, sync=sync)
+
+    def snapshot(self):
+        return LevelDBSnapshot(self.db.CreateSnapshot())
+
+    def close(self):
+        # py-leveldb has no close, the handle is released when deleted
+        self.db = None
+
+
+class LevelDBSnapshot:
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def get(self, k):
+        try:
+            return bytes(self.snapshot.Get(k))
+        except KeyError:
+            return None
+
+    def iterator(self, start=None, stop=None):
+        return self.snapshot.RangeIter(key_from=start, key_to=stop)
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(Backend):
+    """ pure python sorted map, data is lost on close """
+    name = 'memory'
+
+    def __init__(self, path=None, create_if_missing=True):
+        self.data = dict()
+        self.keys_list = list()
+        self.lock = threading.Lock()
+
+    def get(self, k):
+        return self.data.get(k)
+
+    def iterator(self, start=None, stop=None):
+        with self.lock:
+            keys = _range_keys(self.keys_list, start, stop)
+        for k in keys:
+            v = self.data.get(k)
+            if v is not None:
+                yield k, v
+
+    def write(self, items, sync=False):
+        with self.lock:
+            for k, v in items:
+                if v is None:
+                    if k in self.data:
+                        del self.data[k]
+                        del self.keys_list[bisect_left(self.keys_list, k)]
+                else:
+                    if k not in self.data:
+                        insort(self.keys_list, k)
+                    self.data[k] = bytes(v)
+
+    def snapshot(self):
+        with self.lock:
+            return MemorySnapshot(self.data.copy(), self.keys_list.copy())
+
+    def close(self):
+        self.data.clear()
+        self.keys_list.clear()
+
+
+class MemorySnapshot:
+    def __init__(self, data, keys_list):
+        self.data = data
+        self.keys_list = keys_list
+
+    def get(self, k):
+        return self.data.get(k)
+
+    def iterator(self, start=None, stop=None):
+        for k in _range_keys(self.keys_list, start, stop):
+            yield k, self.data[k]
+
+    def close(self):
+        self.data = self.keys_list = None
+
+
+def _range_keys(keys_list, start, stop):
+    lo = 0 if start is None else bisect_left(keys_list, start)
+    hi = len(keys_list) if stop is None else bisect_right(keys_list, stop)
+    return keys_list[lo:hi]
+
+
+backends = {
+    'plyvel': PlyvelBackend,
+    'leveldb': LevelDBBackend,
+    'memory': MemoryBackend,
+}
+default_backend = 'plyvel' if plyvel else 'leveldb'
+BackendError = tuple(e for e in (
+    plyvel.Error if plyvel else None,
+    leveldb.LevelDBError if leveldb else None) if e is not None)
+
+
+def create_backend(path, create_if_missing=False, name=None):
+    name = name or default_backend
+    if name not in backends:
+        raise ValueError('Unknown database backend "{}", select from {}'.format(name, list(backends)))
+    return backends[name](path, create_if_missing)
+
+
+__all__ = [
+    "Backend",
+    "PlyvelBackend",
+    "LevelDBBackend",
+    "MemoryBackend",
+    "BackendError",
+    "default_backend",
+    "create_backend",
+]
@@ -1,10 +1,12 @@
 from bc4py.config import C, V, P, NewInfo
 from bc4py.chain.utils import signature2bin, bin2signature
 from bc4py.chain.tx import TX
-from bc4py.chain.block import Block
+from bc4py.chain.block import Block, LazyTXs
 from bc4py.user import Balance, Accounting
 from bc4py.database.account import *
 from bc4py.database.create import closing, create_db
+from bc4py.database.header import HeaderTable, rebuild_header_table
+from bc4py.database.backend import create_backend, default_backend, BackendError
 import struct
 import weakref
 import os
@@ -14,6 +16,12 @@ import bjson
 from binascii import hexlify, unhexlify
 import time
 import pickle
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from bisect import bisect_left, bisect_right, insort
+import heapq
+import queue
 from nem_ed25519.key import is_address
 
 # http://blog.livedoor.jp/wolf200x/archives/53052954.html
@@ -21,40 +29,194 @@ from nem_ed25519.key import is_address
 # https://tangerina.jp/blog/leveldb-1.20-build/
 
 
-try:
-    import plyvel
-    is_plyvel = True
-    create_level_db = plyvel.DB
-except ImportError:
-    import leveldb
-    is_plyvel = False
-    create_level_db = leveldb.LevelDB
-
-
+struct_height = struct.Struct('>I')
 struct_block = struct.Struct('>II32s80sBI')
-struct_tx = struct.Struct('>4I')
+struct_tx = struct.Struct('>5I')
 struct_address = struct.Struct('>40s32sB')
 struct_address_idx = struct.Struct('>IQ?')
+struct_unspent = struct.Struct('>IQIB')
 struct_coins = struct.Struct('>II')
 struct_construct_key = struct.Struct('>40sQ')
 struct_construct_value = struct.Struct('>32s32s')
 struct_validator_key = struct.Struct('>40sQ')
 struct_validator_value = struct.Struct('>40sb32sb')
+struct_verified = struct.Struct('>I32s')
+# starter file, [magic]-[record]-[record]-.. record is [payload_len I]-[crc32 I]-[payload]
+# payload is [block 80s]-[height I]-[flag B]-[work_hash 32s]-[inner_score d]-[tx_num I]-[tx]-[tx]-..
+# tx is [bin_len I]-[sign_len I]-[tx.b]-[signature]
+struct_starter_record = struct.Struct('>II')
+struct_starter_block = struct.Struct('>80sIB32sdI')
+struct_starter_tx = struct.Struct('>II')
+struct_mempool_tx = struct.Struct('>IId')
 
 # constant
 ITER_ORDER = 'big'
-DB_VERSION = 0  # increase if you change database structure
+DB_VERSION = 2  # increase if you change database structure
 ZERO_FILLED_HASH = b'\x00' * 32
 DUMMY_VALIDATOR_ADDRESS = b'\x00' * 40
 STARTER_NUM = 3
+STARTER_MAGIC = b'bc4py-starter-v1'
+MEMPOOL_MAGIC = b'bc4py-mempool-v1'
+MEMPOOL_FILE_NAME = 'mempool.dat'
+PRUNE_BATCH_BLOCKS = 100
+# fully spent txs of the types are pruned, without message and user's log
+# others are read by contract/validator/mintcoin
+PRUNABLE_TX_TYPES = (C.TX_TRANSFER, C.TX_POW_REWARD, C.TX_POS_REWARD)
 database_tuple = ("_block", "_tx", "_used_index", "_block_index",
-                  "_address_index", "_coins", "_contract", "_validator")
+                  "_address_index", "_coins", "_contract", "_validator", "_coins_count", "_unspent", "_meta",
+                  "_undo")
+# all tables are stored in one LevelDB, separated by one byte key prefix
+database_prefix = {
+    "_block": b'\x00',
+    "_tx": b'\x01',
+    "_used_index": b'\x02',
+    "_block_index": b'\x03',
+    "_address_index": b'\x04',
+    "_coins": b'\x05',
+    "_contract": b'\x06',
+    "_validator": b'\x07',
+    "_coins_count": b'\x08',
+    "_unspent": b'\x09',
+    "_meta": b'\x0a',
+    "_undo": b'\x0b',
+}
+# old value is not in batch, read from database
+UNDO_MISSING = object()
 # basic config
 config = {
     'full_address_index': True,  # all address index?
+    'cashe_limit_size': 64 * 1024 * 1024,  # decoded Block/TX cashe limit by binary size
+    'backend': default_backend,  # key/value engine, plyvel, leveldb or memory
+    'write_behind': True,  # write committed batch by background thread
+    'max_pending_batches': 16,  # batch_commit waits if pending batches over
+    'sync_batches': 1,  # sync every N batches, None is disabled
+    'sync_seconds': None,  # sync every T seconds, None is disabled
+    'undo_depth': C.CASHE_LIMIT * 10,  # keep undo records of blocks, limit of rollback_to
+    'mempool_max_size': 32 * 1024 * 1024,  # unconfirmed txs limit by binary size with signature
+    'mempool_max_txs': 50000,  # unconfirmed txs limit by count
 }
 
 
+class DecodedCashe:
+    """
+    LRU cashe of decoded Block/TX objects, limited by total binary size
+    cashed objects are not given to callers, DataBase returns copies
+    """
+
+    def __init__(self, limit_size):
+        self.data = OrderedDict()  # {hash: (obj, size),..}
+        self.limit_size = limit_size
+        self.size = 0
+        self.hit = 0
+        self.miss = 0
+        self.eviction = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key, max_height=None):
+        # object higher than max_height is missed
+        with self.lock:
+            if key in self.data:
+                obj = self.data[key][0]
+                if max_height is None or obj.height <= max_height:
+                    self.data.move_to_end(key)
+                    self.hit += 1
+                    return obj
+            self.miss += 1
+            return None
+
+    def put(self, key, obj, size):
+        with self.lock:
+            if key in self.data:
+                return
+            self.data[key] = (obj, size)
+            self.size += size
+            while self.size > self.limit_size and len(self.data) > 0:
+                dummy, (dummy, old_size) = self.data.popitem(last=False)
+                self.size -= old_size
+                self.eviction += 1
+
+    def pop(self, key):
+        with self.lock:
+            if key in self.data:
+                dummy, size = self.data.pop(key)
+                self.size -= size
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.size = 0
+
+    def getinfo(self):
+        return {
+            'objects': len(self.data),
+            'size': self.size,
+            'limit_size': self.limit_size,
+            'hit': self.hit,
+            'miss': self.miss,
+            'eviction': self.eviction}
+
+
+class SortedBatch(dict):
+    """
+    batch table of DataBase, keeps sorted key list for range iteration
+    value None is deleted key on commit
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.keys_list = list()
+        self.undo = None  # {key: old value,..} recorded while not None
+
+    def __setitem__(self, key, value):
+        if self.undo is not None and key not in self.undo:
+            self.undo[key] = dict.get(self, key, UNDO_MISSING)
+        if key not in self:
+            insort(self.keys_list, key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        del self.keys_list[bisect_left(self.keys_list, key)]
+
+    def clear(self):
+        super().clear()
+        self.keys_list.clear()
+
+    def irange(self, start, stop):
+        # yield (key, value) of start <= key <= stop, sorted
+        lo = bisect_left(self.keys_list, start)
+        hi = bisect_right(self.keys_list, stop)
+        for k in self.keys_list[lo:hi]:
+            yield k, dict.__getitem__(self, k)
+
+
+class ReadView:
+    """ LevelDB snapshot and the chain tip at the time """
+    __slots__ = ("snapshot", "pending", "root_block", "best_block", "best_chain")
+
+    def __init__(self, snapshot, pending, root_block, best_block, best_chain):
+        self.snapshot = snapshot
+        self.pending = pending  # batches not written to snapshot
+        self.root_block = root_block  # last block of the snapshot
+        self.best_block = best_block
+        self.best_chain = best_chain
+
+    def __repr__(self):
+        return "<ReadView root={} best={}>".format(self.root_block, self.best_block)
+
+
+def _priority_iter(source, priority):
+    for k, v in source:
+        yield k, priority, v
+
+
+def _load_txs(hashes):
+    return tx_builder.get_txs(hashes)
+
+
 class DataBase:
     def __init__(self, f_dummy=False, **kwargs):
         if f_dummy:
@@ -66,60 +228,93 @@ class DataBase:
         config.update(kwargs)  # extra settings
         self.event = threading.Event()
         self.event.set()
+        self.batch_lock = threading.Lock()  # wait and clear event atomically
         # already used => LevelDBError
         if os.path.exists(dirs):
             f_create = False
-        else:
-            logging.debug('No db dir, create database first.')
-            os.mkdir(dirs)
+        elif config['backend'] == 'memory':
             f_create = True
-        self._block = create_level_db(os.path.join(dirs, 'block'), create_if_missing=f_create)
-        self._tx = create_level_db(os.path.join(dirs, 'tx'), create_if_missing=f_create)
-        self._used_index = create_level_db(os.path.join(dirs, 'used-index'), create_if_missing=f_create)
-        self._block_index = create_level_db(os.path.join(dirs, 'block-index'), create_if_missing=f_create)
-        self._address_index = create_level_db(os.path.join(dirs, 'address-index'), create_if_missing=f_create)
-        self._coins = create_level_db(os.path.join(dirs, 'coins'), create_if_missing=f_create)
-        self._contract = create_level_db(os.path.join(dirs, 'contract'), create_if_missing=f_create)
-        self._validator = create_level_db(os.path.join(dirs, 'validator'), create_if_missing=f_create)
+            os.mkdir(dirs)
+        else:
+            from bc4py.database.migrate import migrate_database
+            f_create = not migrate_database(home_dir=V.DB_HOME_DIR)
+            if f_create:
+                logging.debug('No db dir, create database first.')
+                os.mkdir(dirs)
+        self._db = create_backend(os.path.join(dirs, 'chain'), create_if_missing=f_create, name=config['backend'])
         self.batch = None
         self.batch_thread = None
-        logging.debug(':create database connect, plyvel={} path={}'.format(is_plyvel, dirs.replace("\\", "/")))
+        self.cashe = DecodedCashe(limit_size=config['cashe_limit_size'])
+        # lock commit and chain tip update, for read_view
+        self.commit_lock = threading.RLock()
+        self.local = threading.local()
+        # committed batches not written yet, [old,.. new] replaced on change
+        self.pending = list()
+        self.pending_lock = threading.Lock()
+        self.commit_que = queue.Queue(maxsize=config['max_pending_batches'])
+        self.committer = None
+        self.committer_error = None
+        self.unsynced_count = 0
+        self.last_sync_time = time.time()
+        if config['write_behind']:
+            self.committer = threading.Thread(target=self._commit_loop, name='Committer', daemon=True)
+            self.committer.start()
+        self.headers = HeaderTable(dirs)
+        self.header_check()
+        logging.debug(':create database connect, backend={} path={}'.format(self._db.name, dirs.replace("\\", "/")))
 
     def close(self):
-        if is_plyvel:
-            for name in database_tuple:
-                getattr(self, name).close()
-        # else:  # TODO: how to close?
-        #    for name in database_tuple:
-        #        print(getattr(self, name).GetStats())
-        #        getattr(self, name).__dell__()
+        if self.committer:
+            self.commit_que.put(None)
+            self.committer.join()
+        self.headers.close()
+        self._db.close()
         logging.info("Close database connection.")
 
+    def header_check(self):
+        # header table is written when batch is committed, before committer writes the batch
+        # so it may be longer than database after crash, cut headers not written
+        height = self.headers.height
+        while height >= 0 and self._get('_block_index', height.to_bytes(4, ITER_ORDER)) is None:
+            height -= 1
+        if height < self.headers.height:
+            logging.warning("Header table is longer than database, truncate to {}.".format(height))
+            self.headers.truncate(height)
+        # it may be shorter than database
+        if height >= 0 and self.headers.get_hash(height) != self._get('_block_index', height.to_bytes(4, ITER_ORDER)):
+            logging.warning("Header table is not match database, rebuild all.")
+            rebuild_header_table(db=self, start_height=0)
+        elif self._get('_block_index', (height+1).to_bytes(4, ITER_ORDER)) is not None:
+            logging.info("Header table is shorter than database, rebuild from {}.".format(height+1))
+            rebuild_header_table(db=self, start_height=height+1)
+
     def batch_create(self):
+        assert not self.is_batch_thread(), 'batch is already start.'
+        if self.committer_error:
+            raise BlockBuilderError('Committer stopped by "{}".'.format(self.committer_error))
+        # insert thread and prune thread use one batch slot
+        with self.batch_lock:
+            if not self.event.wait(timeout=self.timeout):
+                raise TimeoutError('batch_create timeout.')
+            self.event.clear()
         assert self.batch is None, 'batch is already start.'
-        if not self.event.wait(timeout=self.timeout):
-            raise TimeoutError('batch_create timeout.')
-        self.event.clear()
         self.batch = dict()
         for name in database_tuple:
-            self.batch[name] = dict()
+            self.batch[name] = SortedBatch()
         self.batch_thread = threading.current_thread()
         logging.debug(":Create database batch.")
 
     def batch_commit(self):
         assert self.batch, 'Not created batch.'
-        if is_plyvel:
-            for name, memory in self.batch.items():
-                batch = getattr(self, name).write_batch(sync=self.sync)
-                for k, v in memory.items():
-                    batch.put(k, v)
-                batch.write()
+        if self.committer:
+            # written by committer thread, read from pending until written
+            batch = self.batch
+            with self.pending_lock:
+                self.pending = self.pending + [batch]
+            self.commit_que.put(batch)
         else:
-            for name, memory in self.batch.items():
-                new_data = leveldb.WriteBatch()
-                for k, v in memory.items():
-                    new_data.Put(k, v)
-                getattr(self, name).Write(new_data, sync=self.sync)
+            # all tables are written by one atomic batch
+            self._db.write(self._batch_items(self.batch), sync=self.sync)
         self.batch = None
         self.batch_thread = None
         self.event.set()
@@ -128,22 +323,195 @@ class DataBase:
     def batch_rollback(self):
         self.batch = None
         self.batch_thread = None
+        # objects decoded from the rollback batch may be cashed
+        self.cashe.clear()
         self.event.set()
         logging.debug("Rollback database.")
 
     def is_batch_thread(self):
         return self.batch and self.batch_thread is threading.current_thread()
 
-    def read_block(self, blockhash):
-        if self.is_batch_thread() and blockhash in self.batch['_block']:
-            b = self.batch['_block'][blockhash]
-        elif is_plyvel:
-            b = self._block.get(blockhash, default=None)
+    @staticmethod
+    def _batch_items(batch):
+        return [(database_prefix[name] + k, v) for name, memory in batch.items() for k, v in memory.items()]
+
+    def _is_sync_time(self):
+        # durability policy
+        if not self.sync:
+            return False
+        elif config['sync_batches'] and config['sync_batches'] <= self.unsynced_count:
+            return True
+        elif config['sync_seconds'] is not None and config['sync_seconds'] <= time.time() - self.last_sync_time:
+            return True
+        return False
+
+    def _commit_loop(self):
+        while True:
+            try:
+                batch = self.commit_que.get(timeout=config['sync_seconds'])
+            except queue.Empty:
+                if self.unsynced_count > 0 and self._is_sync_time():
+                    # sync writes flush older writes too
+                    self._db.write([], sync=True)
+                    self.unsynced_count = 0
+                    self.last_sync_time = time.time()
+                continue
+            try:
+                if batch is None:
+                    if self.unsynced_count > 0:
+                        self._db.write([], sync=True)
+                    return
+                self.unsynced_count += 1
+                f_sync = self._is_sync_time()
+                self._db.write(self._batch_items(batch), sync=f_sync)
+                if f_sync:
+                    self.unsynced_count = 0
+                    self.last_sync_time = time.time()
+                with self.pending_lock:
+                    self.pending = [b for b in self.pending if b is not batch]
+            except Exception as e:
+                # pending batches are kept for reading
+                self.committer_error = e
+                logging.critical("Failed write batch, stop committer. '{}'".format(e), exc_info=True)
+                return
+            finally:
+                self.commit_que.task_done()
+
+    def flush(self):
+        # wait for all committed batches written
+        if self.committer:
+            self.commit_que.join()
+
+    @contextmanager
+    def read_view(self):
+        """
+        reads of this thread are from one snapshot while in this context
+        view has the chain tip matching the snapshot
+        """
+        view = getattr(self.local, 'view', None)
+        if view is not None:
+            yield view  # nested
+            return
+        elif self.is_batch_thread():
+            # batch thread reads the newest
+            yield ReadView(None, self.pending, builder.root_block, builder.best_block, list(builder.best_chain or ()))
+            return
+        with self.commit_lock:
+            # pending first, written batch is removed from pending after written
+            pending = self.pending
+            snapshot = self._db.snapshot()
+            view = ReadView(snapshot, pending, builder.root_block, builder.best_block, list(builder.best_chain or ()))
+        self.local.view = view
+        try:
+            yield view
+        finally:
+            self.local.view = None
+            snapshot.close()
+
+    def get_view(self):
+        return getattr(self.local, 'view', None)
+
+    def _view_height(self):
+        # last height readable from this thread
+        view = self.get_view()
+        if view is None or view.root_block is None or view.root_block.height is None:
+            return None
+        return view.root_block.height
+
+    def _reader(self):
+        # (database or snapshot, pending batches)
+        view = self.get_view()
+        if view is None:
+            return self._db, self.pending
+        return view.snapshot, view.pending
+
+    def _overlays(self, name, pending, f_batch=True):
+        # batch tables to read before database, newer first
+        overlays = [batch[name] for batch in reversed(pending)]
+        if f_batch and self.is_batch_thread():
+            overlays.insert(0, self.batch[name])
+        return overlays
+
+    def _get(self, name, k):
+        # batch first, pending second, database last
+        reader, pending = self._reader()
+        for overlay in self._overlays(name, pending):
+            if k in overlay:
+                return overlay[k]  # None is deleted
+        return reader.get(database_prefix[name] + k)
+
+    def _get_many(self, name, keys, f_batch=True):
+        # return {key: value or None,..}, read by one snapshot with sorted keys
+        prefix = database_prefix[name]
+        result = dict()
+        view = self.get_view()
+        if view is None:
+            pending = self.pending
+            snapshot = self._db.snapshot()
         else:
-            b = self._block.Get(blockhash, default=None)
+            pending = view.pending
+            snapshot = view.snapshot
+        try:
+            overlays = self._overlays(name, pending, f_batch)
+            get = snapshot.get
+            for k in sorted(keys):
+                if k in result:
+                    continue  # duplicated
+                for overlay in overlays:
+                    if k in overlay:
+                        result[k] = overlay[k]
+                        break
+                else:
+                    result[k] = get(prefix + k)
+        finally:
+            if view is None:
+                snapshot.close()
+        return result
+
+    def _iter(self, name, start, stop):
+        # yield (key, value) of the table, key includes one byte prefix
+        # records from database are not copied, decode by unpack_from(k, 1)
+        # batch and pending are merged, newer value is used on same key
+        prefix = database_prefix[name]
+        reader, pending = self._reader()
+        db_iter = reader.iterator(start=prefix+start, stop=prefix+stop)
+        overlays = self._overlays(name, pending)
+        if len(overlays) == 0:
+            yield from db_iter
+            return
+        sources = [((prefix+k, v) for k, v in overlay.irange(start, stop)) for overlay in overlays] + [db_iter]
+        last_key = None
+        for k, priority, v in heapq.merge(*[_priority_iter(source, i) for i, source in enumerate(sources)]):
+            if k == last_key:
+                continue  # older value
+            last_key = k
+            if v is not None:
+                yield k, v  # None is deleted
+
+    def _cashe_get(self, key):
+        # object newer than read_view is not readable
+        obj = self.cashe.get(key, max_height=self._view_height())
+        return None if obj is None else obj.copy()
+
+    def read_block(self, blockhash):
+        block = self._cashe_get(blockhash)
+        if block is not None:
+            return block
+        b = self._get('_block', blockhash)
         if b is None:
             return None
-        b = bytes(b)
+        return self._decode_block(blockhash, b)
+
+    def read_blocks(self, hashes):
+        # [block or None,..] same order as hashes
+        result = {blockhash: self._cashe_get(blockhash) for blockhash in hashes}
+        missing = [blockhash for blockhash, block in result.items() if block is None]
+        for blockhash, b in self._get_many('_block', missing).items():
+            if b is not None:
+                result[blockhash] = self._decode_block(blockhash, b)
+        return [result[blockhash] for blockhash in hashes]
+
+    def _decode_block(self, blockhash, b):
         height, _time, work, b_block, flag, tx_len = struct_block.unpack_from(b)
         idx = struct_block.size
         assert len(b) == idx+tx_len, 'Not correct size. [{}={}]'.format(len(b), idx+tx_len)
@@ -151,203 +519,204 @@ class DataBase:
         block.height = height
         block.work_hash = work
         block.flag = flag
-        # block.txs = [self.read_tx(b[idx+32*i:idx+32*i+32]) for i in range(tx_len//32)]
-        block.txs = [tx_builder.get_tx(b[idx+32*i:idx+32*i+32]) for i in range(tx_len//32)]
-        return block
+        # txs are read when required, most of callers need only header
+        block.txs = LazyTXs(hashes=[b[idx+32*i:idx+32*i+32] for i in range(tx_len//32)],
+                            loader=_load_txs)
+        self.cashe.put(blockhash, block, len(b))
+        return block.copy()
 
     def read_block_hash(self, height):
         b_height = height.to_bytes(4, ITER_ORDER)
         if self.is_batch_thread() and b_height in self.batch['_block_index']:
             return self.batch['_block_index'][b_height]
-        elif is_plyvel:
-            b = self._block_index.get(b_height, default=None)
-        else:
-            b = self._block_index.Get(b_height, default=None)
-        if b is None:
+        view_height = self._view_height()
+        if view_height is not None and height > view_height:
             return None
-        else:
-            return bytes(b)
-
-    def read_block_hash_iter(self, start_height=0):
-        f_batch = self.is_batch_thread()
-        batch_copy = self.batch['_block_index'].copy() if self.batch else dict()
+        blockhash = self.headers.get_hash(height)
+        if blockhash is not None:
+            return blockhash
+        return self._get('_block_index', b_height)
+
+    def read_block_header_iter(self, start_height=0, stop_height=None, reverse=False):
+        # height, hash, previous_hash, time, bits, flag, work_hash
+        view_height = self._view_height()
+        if view_height is not None and (stop_height is None or stop_height > view_height):
+            stop_height = view_height
+        return self.headers.iter_range(start_height, stop_height, reverse)
+
+    def read_block_hash_iter(self, start_height=0, f_header=True):
+        if f_header and not self.is_batch_thread():
+            # header table first, database second
+            for height, blockhash, *dummy in self.read_block_header_iter(start_height):
+                yield height, blockhash
+            start_height = max(start_height, self.headers.height + 1)
         start = start_height.to_bytes(4, ITER_ORDER)
-        if is_plyvel:
-            block_iter = self._block_index.iterator(start=start)
-        else:
-            block_iter = self._block_index.RangeIter(key_from=start)
-        for b_height, blockhash in block_iter:
+        stop = b'\xff' * 4
+        for k, blockhash in self._iter('_block_index', start, stop):
             # height, blockhash
-            b_height = bytes(b_height)
-            blockhash = bytes(blockhash)
-            if f_batch and b_height in batch_copy:
-                blockhash = batch_copy[b_height]
-                del batch_copy[b_height]
-            yield int.from_bytes(b_height, ITER_ORDER), blockhash
-        if f_batch:
-            for b_height, blockhash in sorted(batch_copy.items(), key=lambda x: x[0]):
-                yield int.from_bytes(b_height, ITER_ORDER), blockhash
+            yield struct_height.unpack_from(k, 1)[0], bytes(blockhash)
 
     def read_tx(self, txhash):
-        if self.is_batch_thread() and txhash in self.batch['_tx']:
-            b = self.batch['_tx'][txhash]
-        elif is_plyvel:
-            b = self._tx.get(txhash, default=None)
-        else:
-            b = self._tx.Get(txhash, default=None)
+        tx = self._cashe_get(txhash)
+        if tx is not None:
+            return tx
+        b = self._get('_tx', txhash)
         if b is None:
             return None
-        b = bytes(b)
-        height, _time, bin_len, sign_len = struct_tx.unpack_from(b)
-        b_tx = b[16:16+bin_len]
-        b_sign = b[16+bin_len:16+bin_len+sign_len]
-        assert len(b) == 16+bin_len+sign_len, 'Wrong len [{}={}]'\
-            .format(len(b), 16+bin_len+sign_len)
-        tx = TX(binary=b_tx)
+        return self._decode_tx(txhash, b)
+
+    def read_txs(self, hashes):
+        # [tx or None,..] same order as hashes
+        result = {txhash: self._cashe_get(txhash) for txhash in hashes}
+        missing = [txhash for txhash, tx in result.items() if tx is None]
+        for txhash, b in self._get_many('_tx', missing).items():
+            if b is not None:
+                result[txhash] = self._decode_tx(txhash, b)
+        return [result[txhash] for txhash in hashes]
+
+    def _decode_tx(self, txhash, b):
+        height, position, _time, bin_len, sign_len = struct_tx.unpack_from(b)
+        idx = struct_tx.size
+        assert len(b) == idx+bin_len+sign_len, 'Wrong len [{}={}]'\
+            .format(len(b), idx+bin_len+sign_len)
+        # tx.b is kept by TX, signature is copied by sign
+        view = memoryview(b)
+        tx = TX(binary=bytes(view[idx:idx+bin_len]))
         tx.height = height
-        tx.signature = bin2signature(b_sign)
-        return tx
+        tx.signature = bin2signature(view[idx+bin_len:idx+bin_len+sign_len])
+        self.cashe.put(txhash, tx, len(b))
+        return tx.copy()
+
+    def read_tx_position(self, txhash):
+        # position of tx in the block included
+        b = self._get('_tx', txhash)
+        if b is None:
+            return None
+        height, position, *dummy = struct_tx.unpack_from(b)
+        return position
 
     def read_usedindex(self, txhash):
-        if self.is_batch_thread() and txhash in self.batch['_used_index']:
-            b = self.batch['_used_index'][txhash]
-        elif is_plyvel:
-            b = self._used_index.get(txhash, default=None)
-        else:
-            b = self._used_index.Get(txhash, default=None)
+        b = self._get('_used_index', txhash)
         if b is None:
             return set()
         else:
             return set(b)
 
+    def read_usedindex_many(self, hashes):
+        # [usedindex,..] same order as hashes
+        result = self._get_many('_used_index', hashes)
+        return [set() if result[txhash] is None else set(result[txhash]) for txhash in hashes]
+
     def read_address_idx(self, address, txhash, index):
         k = address.encode() + txhash + index.to_bytes(1, ITER_ORDER)
-        if self.is_batch_thread() and k in self.batch['_address_index']:
-            b = self.batch['_address_index'][k]
-        elif is_plyvel:
-            b = self._address_index.get(k, default=None)
-        else:
-            b = self._address_index.Get(k, default=None)
+        b = self._get('_address_index', k)
         if b is None:
             return None
-        b = bytes(b)
         # coin_id, amount, f_used
         return struct_address_idx.unpack(b)
 
     def read_address_idx_iter(self, address):
-        f_batch = self.is_batch_thread()
-        batch_copy = self.batch['_address_index'].copy() if self.batch else dict()
         b_address = address.encode()
         start = b_address+b'\x00'*(32+1)
         stop = b_address+b'\xff'*(32+1)
-        if is_plyvel:
-            address_iter = self._address_index.iterator(start=start, stop=stop)
-        else:
-            address_iter = self._address_index.RangeIter(key_from=start, key_to=stop)
-        for k, v in address_iter:
-            k, v = bytes(k), bytes(v)
+        for k, v in self._iter('_address_index', start, stop):
             # address, txhash, index, coin_id, amount, f_used
-            if f_batch and k in batch_copy and start <= k <= stop:
-                v = batch_copy[k]
-                del batch_copy[k]
-            yield struct_address.unpack(k) + struct_address_idx.unpack(v)
-        if f_batch:
-            for k, v in sorted(batch_copy.items(), key=lambda x: x[0]):
-                if k.startswith(b_address) and start <= k <= stop:
-                    yield struct_address.unpack(k) + struct_address_idx.unpack(v)
+            yield struct_address.unpack_from(k, 1) + struct_address_idx.unpack_from(v)
+
+    def read_unspent_iter(self, address):
+        # only unspent outputs, spent outputs are on "_address_index"
+        b_address = address.encode()
+        start = b_address+b'\x00'*(32+1)
+        stop = b_address+b'\xff'*(32+1)
+        for k, v in self._iter('_unspent', start, stop):
+            # address, txhash, index, coin_id, amount, height, tx_type
+            yield struct_address.unpack_from(k, 1) + struct_unspent.unpack_from(v)
+
+    def read_meta(self, key):
+        return self._get('_meta', key)
 
     def read_coins_iter(self, coin_id):
-        f_batch = self.is_batch_thread()
-        batch_copy = self.batch['_coins'].copy() if self.batch else dict()
         b_coin_id = coin_id.to_bytes(4, ITER_ORDER)
         start = b_coin_id + b'\x00'*4
         stop = b_coin_id + b'\xff'*4
-        if is_plyvel:
-            coins_iter = self._coins.iterator(start=start, stop=stop)
-        else:
-            coins_iter = self._coins.RangeIter(key_from=start, key_to=stop)
-        for k, v in coins_iter:
-            k, v = bytes(k), bytes(v)
+        for k, v in self._iter('_coins', start, stop):
             # coin_id, index, txhash
-            if f_batch and k in batch_copy and start <= k <= stop:
-                v = batch_copy[k]
-                del batch_copy[k]
-            dummy, index = struct_coins.unpack(k)
-            txhash, (params, setting) = v[:32], bjson.loads(v[32:])
+            dummy, index = struct_coins.unpack_from(k, 1)
+            txhash, (params, setting) = bytes(v[:32]), bjson.loads(bytes(v[32:]))
             yield index, txhash, params, setting
-        if f_batch:
-            for k, v in sorted(batch_copy.items(), key=lambda x: x[0]):
-                if k.startswith(b_coin_id) and start <= k <= stop:
-                    dummy, index = struct_coins.unpack(k)
-                    txhash, (params, setting) = v[:32], bjson.loads(v[32:])
-                    yield index, txhash, params, setting
 
     def read_contract_iter(self, c_address, start_idx=None):
-        f_batch = self.is_batch_thread()
-        batch_copy = self.batch['_contract'].copy() if self.batch else dict()
         b_c_address = c_address.encode()
         # caution: iterator/RangeIter's result include start and stop, need to add 1.
         start = b_c_address + ((start_idx+1).to_bytes(8, ITER_ORDER) if start_idx else b'\x00'*8)
         stop = b_c_address + b'\xff'*8
-        if is_plyvel:
-            contract_iter = self._contract.iterator(start=start, stop=stop)
-        else:
-            contract_iter = self._contract.RangeIter(key_from=start, key_to=stop)
-        for k, v in contract_iter:
-            k, v = bytes(k), bytes(v)
+        for k, v in self._iter('_contract', start, stop):
             # KEY: [c_address 40s]-[index uint8]
             # VALUE: [start_hash 32s]-[finish_hash 32s]-[bjson(c_method, c_args, c_storage)]
             # c_address, index, start_hash, finish_hash, message
-            if f_batch and k in batch_copy and start <= k <= stop:
-                v = batch_copy[k]
-                del batch_copy[k]
-            dummy, index = struct_construct_key.unpack(k)
-            start_hash, finish_hash, raw_message = v[0:32], v[32:64], v[64:]
-            message = bjson.loads(raw_message)
+            dummy, index = struct_construct_key.unpack_from(k, 1)
+            start_hash, finish_hash = struct_construct_value.unpack_from(v)
+            message = bjson.loads(bytes(v[64:]))
             yield index, start_hash, finish_hash, message
-        if f_batch:
-            for k, v in sorted(batch_copy.items(), key=lambda x: x[0]):
-                if k.startswith(b_c_address) and start <= k <= stop:
-                    dummy, index = struct_construct_key.unpack(k)
-                    start_hash, finish_hash, raw_message = v[0:32], v[32:64], v[64:]
-                    message = bjson.loads(raw_message)
-                    yield index, start_hash, finish_hash, message
 
     def read_validator_iter(self, c_address, start_idx=None):
-        f_batch = self.is_batch_thread()
-        batch_copy = self.batch['_validator'].copy() if self.batch else dict()
         b_c_address = c_address.encode()
         # caution: iterator/RangeIter's result include start and stop, need to add 1.
         start = b_c_address + ((start_idx+1).to_bytes(8, ITER_ORDER) if start_idx else b'\x00' * 8)
         stop = b_c_address + b'\xff'*8
-        # from database
-        if is_plyvel:
-            validator_iter = self._validator.iterator(start=start, stop=stop)
-        else:
-            validator_iter = self._validator.RangeIter(key_from=start, key_to=stop)
-        for k, v in validator_iter:
-            k, v = bytes(k), bytes(v)
+        # from database and batch
+        for k, v in self._iter('_validator', start, stop):
             # KEY [c_address 40s]-[index unit8]
             # VALUE [new_address 40s]-[flag int1]-[txhash 32s]-[sig_diff int1]
-            if f_batch and k in batch_copy and start <= k <= stop:
-                v = batch_copy[k]
-                del batch_copy[k]
-            dummy, index = struct_validator_key.unpack(k)
-            new_address, flag, txhash, sig_diff = struct_validator_value.unpack(v)
+            dummy, index = struct_validator_key.unpack_from(k, 1)
+            new_address, flag, txhash, sig_diff = struct_validator_value.unpack_from(v)
             if new_address == DUMMY_VALIDATOR_ADDRESS:
                 yield index, None, flag, txhash, sig_diff
             else:
                 yield index, new_address.decode(), flag, txhash, sig_diff
-        # from memory
-        if f_batch:
-            for k, v in sorted(batch_copy.items(), key=lambda x: x[0]):
-                if k.startswith(b_c_address) and start <= k <= stop:
-                    dummy, index = struct_validator_key.unpack(k)
-                    new_address, flag, txhash, sig_diff = struct_validator_value.unpack(v)
-                    if new_address == DUMMY_VALIDATOR_ADDRESS:
-                        yield index, None, flag, txhash, sig_diff
-                    else:
-                        yield index, new_address.decode(), flag, txhash, sig_diff
+
+    def undo_begin(self):
+        # record old values of keys written until undo_end
+        assert self.is_batch_thread(), 'Not created batch.'
+        for name in database_tuple:
+            if name != '_undo':
+                self.batch[name].undo = dict()
+
+    def undo_end(self, height):
+        # write undo record of the block
+        assert self.is_batch_thread(), 'Not created batch.'
+        records = list()
+        for index, name in enumerate(database_tuple):
+            batch = self.batch[name]
+            undo, batch.undo = batch.undo, None
+            if not undo:
+                continue
+            committed = self._get_many(name, [k for k, v in undo.items() if v is UNDO_MISSING], f_batch=False)
+            for k, v in undo.items():
+                records.append((index, k, committed[k] if v is UNDO_MISSING else v))
+        self.batch['_undo'][height.to_bytes(4, ITER_ORDER)] = bjson.dumps(records, compress=False)
+
+    def delete_undo(self, height):
+        assert self.is_batch_thread(), 'Not created batch.'
+        self.batch['_undo'][height.to_bytes(4, ITER_ORDER)] = None
+
+    def read_undo(self, height):
+        # [(table name, key, old value),..]
+        b = self._get('_undo', height.to_bytes(4, ITER_ORDER))
+        if b is None:
+            return None
+        return [(database_tuple[index], k, v) for index, k, v in bjson.loads(b)]
+
+    def read_undo_iter(self, start_height):
+        # yield (height, [(table name, key, old value),..]) from start_height
+        for k, v in self._iter('_undo', start_height.to_bytes(4, ITER_ORDER), b'\xff' * 4):
+            records = bjson.loads(bytes(v))
+            yield struct_height.unpack_from(k, 1)[0], [(database_tuple[index], key, old) for index, key, old in records]
+
+    def read_undo_lowest_height(self):
+        for k, v in self._iter('_undo', b'\x00' * 4, b'\xff' * 4):
+            return struct_height.unpack_from(k, 1)[0]
+        return None
 
     def write_block(self, block):
         assert self.is_batch_thread(), 'Not created batch.'
@@ -362,12 +731,12 @@ class DataBase:
         self.batch['_block_index'][b_height] = block.hash
         logging.debug("Insert new block {}".format(block))
 
-    def write_tx(self, tx):
+    def write_tx(self, tx, position):
         assert self.is_batch_thread(), 'Not created batch.'
         bin_len = len(tx.b)
         b_sign = signature2bin(tx.signature)
         sign_len = len(b_sign)
-        b = struct_tx.pack(tx.height, tx.time, bin_len, sign_len)
+        b = struct_tx.pack(tx.height, position, tx.time, bin_len, sign_len)
         b += tx.b + b_sign
         self.batch['_tx'][tx.hash] = b
         logging.debug("Insert new tx {}".format(tx))
@@ -384,21 +753,60 @@ class DataBase:
         self.batch['_address_index'][k] = v
         logging.debug("Insert new address idx {}".format(address))
 
+    def write_meta(self, key, value):
+        assert self.is_batch_thread(), 'Not created batch.'
+        self.batch['_meta'][key] = value
+
+    def prune_block(self, block):
+        # remove tx list from block record, header is kept
+        assert self.is_batch_thread(), 'Not created batch.'
+        b = self._get('_block', block.hash)
+        height, _time, work, b_block, flag, tx_len = struct_block.unpack_from(b)
+        self.batch['_block'][block.hash] = struct_block.pack(height, _time, work, b_block, flag, 0)
+        self.cashe.pop(block.hash)
+
+    def prune_tx(self, txhash, undo_height=None):
+        # remove tx record and usedindex of fully spent tx
+        # undo_height: tx record is restored when rollback the height (spent on the height)
+        assert self.is_batch_thread(), 'Not created batch.'
+        if undo_height is not None:
+            b_height = undo_height.to_bytes(4, ITER_ORDER)
+            records = bjson.loads(self._get('_undo', b_height))
+            records.append((database_tuple.index('_tx'), txhash, self._get('_tx', txhash)))
+            self.batch['_undo'][b_height] = bjson.dumps(records, compress=False)
+        self.batch['_tx'][txhash] = None
+        self.batch['_used_index'][txhash] = None
+        self.cashe.pop(txhash)
+
+    def write_unspent(self, address, txhash, index, coin_id, amount, height, tx_type):
+        assert self.is_batch_thread(), 'Not created batch.'
+        k = address.encode() + txhash + index.to_bytes(1, ITER_ORDER)
+        v = struct_unspent.pack(coin_id, amount, height, tx_type)
+        self.batch['_unspent'][k] = v
+
+    def delete_unspent(self, address, txhash, index):
+        assert self.is_batch_thread(), 'Not created batch.'
+        k = address.encode() + txhash + index.to_bytes(1, ITER_ORDER)
+        self.batch['_unspent'][k] = None
+
     def write_coins(self, coin_id, txhash, params, setting):
         assert self.is_batch_thread(), 'Not created batch.'
-        index = -1
-        for index, *dummy in self.read_coins_iter(coin_id=coin_id): pass
-        index += 1
-        k = coin_id.to_bytes(4, ITER_ORDER) + index.to_bytes(4, ITER_ORDER)
+        b_coin_id = coin_id.to_bytes(4, ITER_ORDER)
+        # KEY: [coin_id uint4] VALUE: [next index uint4]
+        b_index = self._get('_coins_count', b_coin_id)
+        index = 0 if b_index is None else int.from_bytes(b_index, ITER_ORDER)
+        k = b_coin_id + index.to_bytes(4, ITER_ORDER)
         v = txhash + bjson.dumps((params, setting), compress=False)
         self.batch['_coins'][k] = v
+        self.batch['_coins_count'][b_coin_id] = (index+1).to_bytes(4, ITER_ORDER)
         logging.debug("Insert new coins id={}".format(coin_id))
 
     def write_contract(self, c_address, start_tx, finish_hash, message):
         assert self.is_batch_thread(), 'Not created batch.'
         assert len(message) == 3
-        include_block = self.read_block(blockhash=self.read_block_hash(height=start_tx.height))
-        index = start_tx.height * 0xffffffff + include_block.txs.index(start_tx)
+        position = self.read_tx_position(start_tx.hash)
+        assert position is not None, 'Not found start_tx position. {}'.format(start_tx)
+        index = start_tx.height * 0xffffffff + position
         # check newer index already inserted
         last_index = None
         for last_index, *dummy in self.read_contract_iter(c_address=c_address, start_idx=index):
@@ -411,8 +819,9 @@ class DataBase:
 
     def write_validator(self, c_address, new_address, flag, tx, sign_diff):
         assert self.is_batch_thread(), 'Not created batch.'
-        include_block = self.read_block(blockhash=self.read_block_hash(height=tx.height))
-        index = tx.height * 0xffffffff + include_block.txs.index(tx)
+        position = self.read_tx_position(tx.hash)
+        assert position is not None, 'Not found tx position. {}'.format(tx)
+        index = tx.height * 0xffffffff + position
         # check newer index already inserted
         last_index = None
         for last_index, *dummy in self.read_validator_iter(c_address=c_address, start_idx=index):
@@ -428,6 +837,79 @@ class DataBase:
         logging.debug("Insert new validator {} {}".format(c_address, index))
 
 
+def encode_starter_record(block):
+    b = struct_starter_block.pack(block.b, block.height, block.flag, block.work_hash or ZERO_FILLED_HASH,
+                                  block.inner_score, len(block.txs))
+    for tx in block.txs:
+        b_sign = signature2bin(tx.signature)
+        b += struct_starter_tx.pack(len(tx.b), len(b_sign)) + tx.b + b_sign
+    return struct_starter_record.pack(len(b), zlib.crc32(b)) + b
+
+
+def decode_starter_record(b):
+    view = memoryview(b)
+    b_block, height, flag, work_hash, inner_score, tx_num = struct_starter_block.unpack_from(view)
+    block = Block(binary=b_block)
+    block.height = height
+    block.flag = flag
+    block.work_hash = None if work_hash == ZERO_FILLED_HASH else work_hash
+    block.inner_score = inner_score
+    pos = struct_starter_block.size
+    for dummy in range(tx_num):
+        bin_len, sign_len = struct_starter_tx.unpack_from(view, pos)
+        pos += struct_starter_tx.size
+        tx = TX(binary=bytes(view[pos:pos+bin_len]))
+        tx.height = height
+        tx.signature = bin2signature(view[pos+bin_len:pos+bin_len+sign_len])
+        pos += bin_len + sign_len
+        block.txs.append(tx)
+    assert pos == len(b), 'Wrong starter record size [{}!={}]'.format(pos, len(b))
+    return block
+
+
+def _read_record_iter(fp):
+    # yield checksummed records, stop on broken record
+    while True:
+        b = fp.read(struct_starter_record.size)
+        if len(b) == 0:
+            return
+        elif len(b) < struct_starter_record.size:
+            logging.warning("Broken record header, stop reading.")
+            return
+        length, checksum = struct_starter_record.unpack(b)
+        b = fp.read(length)
+        if len(b) < length or zlib.crc32(b) != checksum:
+            logging.warning("Broken record, stop reading.")
+            return
+        yield b
+
+
+def read_starter_iter(fp):
+    """ yield blocks of starter file from old, stop on broken record """
+    if fp.read(len(STARTER_MAGIC)) != STARTER_MAGIC:
+        # old pickled file
+        fp.seek(0)
+        yield from reversed(pickle.load(fp))
+        return
+    for b in _read_record_iter(fp):
+        yield decode_starter_record(b)
+
+
+def encode_mempool_record(tx, first_seen):
+    b_sign = signature2bin(tx.signature)
+    b = struct_mempool_tx.pack(len(tx.b), len(b_sign), first_seen) + tx.b + b_sign
+    return struct_starter_record.pack(len(b), zlib.crc32(b)) + b
+
+
+def decode_mempool_record(b):
+    bin_len, sign_len, first_seen = struct_mempool_tx.unpack_from(b)
+    pos = struct_mempool_tx.size
+    assert pos + bin_len + sign_len == len(b), 'Wrong mempool record size'
+    tx = TX(binary=b[pos:pos+bin_len])
+    tx.signature = bin2signature(b[pos+bin_len:])
+    return tx, first_seen
+
+
 class ChainBuilder:
     def __init__(self, cashe_limit=C.CASHE_LIMIT, batch_size=C.BATCH_SIZE):
         assert cashe_limit > batch_size, 'cashe_limit > batch_size.'
@@ -440,6 +922,16 @@ class ChainBuilder:
         self.best_chain = None
         self.root_block = None
         self.best_block = None
+        # fork choice, cumulative score from root_block of connected blocks
+        self.chain_score = dict()  # blockhash: score
+        self.root_score = 0.0  # score of root_block, scores are not reset when root_block moves
+        self.tips = dict()  # blockhash: None, no child blocks, insertion ordered
+        self.unconnected = set()  # blockhash, previous block is unknown
+        self.best_chain_index = dict()  # height: blockhash of best_chain
+        # pruned node, block bodies and spent txs lower than pruned_height are removed
+        self.prune_depth = None
+        self.pruned_height = 0
+        self.prune_thread = None
         self.db = DataBase(f_dummy=True)
         # levelDBのStreamHandlerを削除
         logging.getLogger().handlers.clear()
@@ -447,21 +939,35 @@ class ChainBuilder:
     def close(self):
         self.db.batch_create()
         self.save_starter()
+        if self.root_block and self.root_block.height is not None:
+            # blocks to root_block are verified, skip on next init
+            self.db.write_meta(b'verified', struct_verified.pack(self.root_block.height, self.root_block.hash))
+        self.db.batch_commit()
+        try:
+            tx_builder.save_unconfirmed(self.db.dirs)
+        except Exception:
+            logging.error("Failed save unconfirmed txs.", exc_info=True)
         self.db.close()
 
     def set_database_path(self, **kwargs):
         try:
             self.db = DataBase(f_dummy=False, **kwargs)
             logging.info("Connect database.")
-        except leveldb.LevelDBError:
+        except BackendError:
             logging.warning("Already connect database.")
         except Exception as e:
             logging.debug("Failed connect database, {}.".format(e))
 
-    def init(self, genesis_block: Block, batch_size=None):
+    def init(self, genesis_block: Block, batch_size=None, prune_depth=None, full_verify=False):
         assert self.db, 'Why database connection failed?'
+        assert prune_depth is None or prune_depth > self.cashe_limit, 'prune_depth > cashe_limit.'
         if batch_size is None:
             batch_size = self.cashe_limit
+        self.prune_depth = prune_depth
+        b_pruned_height = self.db.read_meta(b'pruned_height')
+        if b_pruned_height is not None:
+            self.pruned_height = int.from_bytes(b_pruned_height, ITER_ORDER)
+            logging.info("Pruned node, block bodies are removed to {} height.".format(self.pruned_height))
         # GenesisBlockか確認
         t = time.time()
         try:
@@ -476,16 +982,25 @@ class ChainBuilder:
             self.root_block = Block()
             self.root_block.hash = b'\xff' * 32
             self.chain[genesis_block.hash] = genesis_block
+            self._connect_block(genesis_block)
             self.best_chain = [genesis_block]
+            self.best_chain_index = {genesis_block.height: genesis_block.hash}
             self.best_block = genesis_block
             logging.info("Set dummy block. GenesisBlock={}".format(genesis_block))
             user_account.init()
             return
 
+        # fork chain deeper than memory is removed by undo records
+        self.failmark_file_check()
         # 0HeightよりBlockを取得して確認
         before_block = genesis_block
+        verified_height = self.read_verified_height(full_verify)
+        if verified_height > 0:
+            before_block = self.db.read_block(self.db.read_block_hash(verified_height))
+            user_account.verified_batch_apply(verified_height)
+            logging.info("Skip verify to {} height, verified on last shutdown.".format(verified_height))
         batch_blocks = list()
-        for height, blockhash in self.db.read_block_hash_iter(start_height=1):
+        for height, blockhash in self.db.read_block_hash_iter(start_height=before_block.height+1):
             block = self.db.read_block(blockhash)
             if block.previous_hash != before_block.hash:
                 raise BlockBuilderError("PreviousHash != BlockHash [{}!={}]"
@@ -503,6 +1018,8 @@ class ChainBuilder:
                 # inputs
                 for txhash, txindex in tx.inputs:
                     input_tx = self.db.read_tx(txhash)
+                    if input_tx is None and self.pruned_height > 0:
+                        continue  # fully spent and pruned
                     address, coin_id, amount = input_tx.outputs[txindex]
                     _coin_id, _amount, f_used = self.db.read_address_idx(address, txhash, txindex)
                     usedindex = self.db.read_usedindex(txhash)
@@ -539,13 +1056,43 @@ class ChainBuilder:
                 if tx.hash in tx_builder.unconfirmed:
                     del tx_builder.unconfirmed[tx.hash]
         self.best_chain = list(reversed(memorized_blocks))
+        self.best_chain_index = {block.height: block.hash for block in memorized_blocks}
+        self._reset_chain_score()
         # UserAccount update
         user_account.new_batch_apply(batch_blocks)
         user_account.init()
         logging.info("Init finished, last block is {} {}Sec"
                      .format(before_block, round(time.time()-t, 3)))
 
+    def read_verified_height(self, full_verify=False):
+        """ verified height on last clean shutdown, marker is removed until next shutdown """
+        b = self.db.read_meta(b'verified')
+        if b is None:
+            return 0
+        self.db.batch_create()
+        self.db.write_meta(b'verified', None)
+        self.db.batch_commit()
+        height, blockhash = struct_verified.unpack(b)
+        if full_verify:
+            logging.info("Full verify from genesis block.")
+            return 0
+        elif os.path.exists(os.path.join(self.db.dirs, 'starter.failed.dat')):
+            logging.warning("Found failed mark, full verify from genesis block.")
+            return 0
+        elif self.db.read_block_hash(height) != blockhash:
+            logging.warning("Verified block {} is not on database, full verify.".format(height))
+            return 0
+        return height
+
     def save_starter(self):
+        # write temporary file first, do not break old files on crash
+        tmp_path = os.path.join(self.db.dirs, 'starter.tmp')
+        with open(tmp_path, mode='bw') as fp:
+            fp.write(STARTER_MAGIC)
+            for block in reversed(self.best_chain):
+                fp.write(encode_starter_record(block))
+            fp.flush()
+            os.fsync(fp.fileno())
         for index in reversed(range(STARTER_NUM)):
             target_path = os.path.join(self.db.dirs, 'starter.{}.dat'.format(index))
             if os.path.exists(target_path):
@@ -553,21 +1100,24 @@ class ChainBuilder:
                 if os.path.exists(old_file_path):
                     os.remove(old_file_path)
                 os.rename(target_path, old_file_path)
-        with open(os.path.join(self.db.dirs, 'starter.0.dat'), mode='bw') as fp:
-            pickle.dump(self.best_chain, fp, protocol=4)
+        os.replace(tmp_path, os.path.join(self.db.dirs, 'starter.0.dat'))
 
     def load_starter(self, root_block):
-        self.failmark_file_check()
         memorized_blocks = list()
         for index in range(STARTER_NUM+1):
             target_path = os.path.join(self.db.dirs, 'starter.{}.dat'.format(index))
             if os.path.exists(target_path):
                 with open(target_path, mode='br') as fp:
-                    for block in reversed(pickle.load(fp)):
+                    for block in read_starter_iter(fp):
                         if root_block.hash == block.previous_hash:
                             memorized_blocks.append(block)
                             root_block = block
             if len(memorized_blocks) > 0:
+                # binary record has no chain status, all blocks are best chain
+                for index, block in enumerate(memorized_blocks):
+                    block.f_orphan = False
+                    if index + 1 < len(memorized_blocks):
+                        block.next_hash = memorized_blocks[index+1].hash
                 logging.debug("Load {} blocks, best={}".format(len(memorized_blocks), root_block))
                 return memorized_blocks, root_block
         raise BlockBuilderError("Failed load block from file, cannot find starter.n.dat?")
@@ -583,6 +1133,13 @@ class ChainBuilder:
                 os.remove(mark_file)
                 logging.debug("Removed starter.{}.dat".format(index))
                 return
+        lowest_height = self.db.read_undo_lowest_height()
+        if lowest_height is not None:
+            height = max(self.db.headers.height - self.cashe_limit, lowest_height, self.pruned_height + 1, 1)
+            logging.warning("System is in fork chain, rollback database to {} height.".format(height))
+            self.rollback_to(height)
+            os.remove(mark_file)
+            return
         logging.critical('System is in fork chain, so we delete "db" from "blockchain-py" '
                          'folder and resync blockchain from 0 height.')
         del self.db
@@ -600,48 +1157,155 @@ class ChainBuilder:
         if os.path.exists(mark_file):
             os.remove(mark_file)
 
+    def rollback_to(self, height):
+        """
+        unwind blocks on database higher than height by undo records
+        block of the height is moved to memory, resync from the height
+        """
+        top_height = self.db.headers.height
+        if not (1 <= height <= top_height):
+            raise BlockBuilderError('Out of rollback range {} [1~{}].'.format(height, top_height))
+        elif height <= self.pruned_height:
+            raise BlockBuilderError('Cannot rollback to pruned height {}<={}.'.format(height, self.pruned_height))
+        f_running = self.best_block is not None
+        t = time.time()
+        # read before removed
+        best_block = self.db.read_block(self.db.read_block_hash(height))
+        best_block.txs = list(best_block.txs)
+        self.db.batch_create()
+        try:
+            for undo_height in range(top_height, height - 1, -1):
+                records = self.db.read_undo(undo_height)
+                if records is None:
+                    raise BlockBuilderError('Not found undo record of {} height.'.format(undo_height))
+                # newer first, last one is the value before the height
+                for name, k, v in records:
+                    self.db.batch[name][k] = v
+                self.db.delete_undo(undo_height)
+            with self.db.commit_lock:
+                self.db.batch_commit()
+                self.db.headers.truncate(height - 1)
+                self.root_block = self.db.read_block(self.db.read_block_hash(height - 1))
+                self.chain.clear()
+                self.chain[best_block.hash] = best_block
+                self.best_block = best_block
+                self.best_chain = [best_block]
+                self.best_chain_index = {best_block.height: best_block.hash}
+                self._reset_chain_score()
+        except BaseException:
+            self.db.batch_rollback()
+            raise
+        # decoded objects of removed blocks
+        self.db.cashe.clear()
+        for tx in best_block.txs:
+            tx.height = best_block.height
+            tx_builder.chained_tx[tx.hash] = tx
+        self.save_starter()
+        if f_running:
+            user_account.db_balance = Accounting()
+            user_account.verified_batch_apply(self.root_block.height)
+            user_account.new_batch_apply(self.best_chain)
+            user_account.init()
+        logging.info("Rollback database {} blocks to {} height, {}Sec."
+                     .format(top_height - height, height, round(time.time()-t, 3)))
+
     def get_best_chain(self, best_block=None):
         assert self.root_block, 'Do not init.'
         if best_block:
-            best_chain = [best_block]
-            previous_hash = best_block.previous_hash
-            while self.root_block.hash != previous_hash:
-                if previous_hash not in self.chain:
-                    raise BlockBuilderError('Cannot find previousHash, may not main-chain. {}'
-                                            .format(hexlify(previous_hash).decode()))
-                block = self.chain[previous_hash]
-                previous_hash = block.previous_hash
+            # walk to fork point only, lower part is same as self.best_chain
+            best_chain = list()
+            block = best_block
+            while self.best_chain_index.get(block.height) != block.hash:
                 best_chain.append(block)
-            return best_block, best_chain
-        # BestBlockがchainにおける
+                if self.root_block.hash == block.previous_hash:
+                    return best_block, best_chain
+                elif block.previous_hash not in self.chain:
+                    raise BlockBuilderError('Cannot find previousHash, may not main-chain. {}'
+                                            .format(hexlify(block.previous_hash).decode()))
+                block = self.chain[block.previous_hash]
+            main_chain = self.best_chain
+            index = main_chain[0].height - block.height
+            if not (0 <= index < len(main_chain)) or main_chain[index].hash != block.hash:
+                raise BlockBuilderError('Best chain is updated, retry. {}'.format(best_block))
+            return best_block, best_chain + main_chain[index:]
+        # tx height of best_chain is updated by new_block
+        best_chain = list(self.best_chain)
+        assert best_chain, 'Cannot find best_block on get_best_chain? chain={}'.format(list(self.chain))
+        # best_chain = [<height=n>, <height=n-1>, ...]
+        return best_chain[0], best_chain
+
+    def _connect_block(self, block):
+        # 累積scoreを記録してtipsを更新
+        if block.previous_hash == self.root_block.hash:
+            score = self.root_score
+        elif block.previous_hash in self.chain_score:
+            score = self.chain_score[block.previous_hash]
+        else:
+            self.unconnected.add(block.hash)
+            return
+        self.chain_score[block.hash] = score + block.score
+        self.tips.pop(block.previous_hash, None)
+        self.tips[block.hash] = None
+        # previous block arrived after
+        for blockhash in [blockhash for blockhash in self.unconnected
+                          if self.chain[blockhash].previous_hash == block.hash]:
+            self.unconnected.discard(blockhash)
+            self._connect_block(self.chain[blockhash])
+
+    def _reset_chain_score(self):
+        # 全て計算し直す, on init and rollback
+        self.chain_score.clear()
+        self.tips.clear()
+        self.unconnected.clear()
+        self.root_score = 0.0
+        for block in list(self.chain.values()):
+            if block.hash not in self.chain_score:
+                self._connect_block(block)
+
+    def _cut_chain_score(self, removed):
+        # root_block moved to higher, removed blocks are not higher than root_block
+        self.root_score = self.chain_score.get(self.root_block.hash, self.root_score)
+        for blockhash in removed:
+            self.chain_score.pop(blockhash, None)
+            self.tips.pop(blockhash, None)
+            self.unconnected.discard(blockhash)
+        # fork from removed blocks is not connected to root_block
+        cut = {blockhash for blockhash, block in self.chain.items()
+               if block.height == self.root_block.height + 1 and block.previous_hash != self.root_block.hash}
+        if len(cut) == 0:
+            return
+        for block in sorted(self.chain.values(), key=lambda x: x.height):
+            if block.previous_hash in cut:
+                cut.add(block.hash)
+        for blockhash in cut:
+            self.chain_score.pop(blockhash, None)
+            self.tips.pop(blockhash, None)
+            self.unconnected.add(blockhash)
+
+    def _best_tip(self):
+        # 同じscoreなら後に挿入されたもの
         best_score = 0.0
         best_block = None
-        best_chain = list()
-        for block in list(self.chain.values()):
-            if block in best_chain:
-                continue
-            tmp_best_score = block.score
-            tmp_best_block = block
-            tmp_best_chain = [block]
-            while block.previous_hash in self.chain:
-                block = self.chain[block.previous_hash]
-                tmp_best_score += block.score
-                tmp_best_chain.append(block)
-            else:
-                if self.root_block.hash != block.previous_hash:
-                    continue
-            if best_score > tmp_best_score:
+        for blockhash in self.tips:
+            score = self.chain_score[blockhash]
+            if best_score > score:
                 continue
-            best_score = tmp_best_score
-            best_block = tmp_best_block
-            best_chain = tmp_best_chain
-        # txのheightを揃える
-        for block in best_chain:
-            for tx in block.txs:
-                tx.height = block.height
-        assert best_block, 'Cannot find best_block on get_best_chain? chain={}'.format(list(self.chain))
-        # best_chain = [<height=n>, <height=n-1>, ...]
-        return best_block, best_chain
+            best_score = score
+            best_block = self.chain[blockhash]
+        return best_block
+
+    def _fork_branches(self, new_block, old_block):
+        # blocks from tips to common block, newer first
+        new_branch = list()
+        old_branch = list()
+        while new_block.hash != old_block.hash:
+            if new_block.height >= old_block.height:
+                new_branch.append(new_block)
+                new_block = self.chain.get(new_block.previous_hash, self.root_block)
+            if old_block.height > new_block.height:
+                old_branch.append(old_block)
+                old_block = self.chain.get(old_block.previous_hash, self.root_block)
+        return new_branch, old_branch
 
     def batch_apply(self, force=False):
         # 無チェックで挿入するから要注意
@@ -661,10 +1325,12 @@ class ChainBuilder:
                     batch_count -= 1
                     block = best_chain.pop()  # 古いものから順に
                     batched_blocks.append(block)
+                    self.db.undo_begin()
                     self.db.write_block(block)  # Block
                     assert len(block.txs) > 0, "found no tx in {}".format(block)
+                    for position, tx in enumerate(block.txs):
+                        self.db.write_tx(tx, position)  # TX
                     for tx in block.txs:
-                        self.db.write_tx(tx)  # TX
                         # inputs
                         for index, (txhash, txindex) in enumerate(tx.inputs):
                             # DataBase内でのみのUsedIndexを取得
@@ -680,12 +1346,14 @@ class ChainBuilder:
                                     or read_address2user(address=address, cur=cur):
                                 # 必要なAddressのみ
                                 self.db.write_address_idx(address, txhash, txindex, coin_id, amount, True)
+                                self.db.delete_unspent(address, txhash, txindex)
                         # outputs
                         for index, (address, coin_id, amount) in enumerate(tx.outputs):
                             if config['full_address_index'] or is_address(ck=address, prefix=V.BLOCK_CONTRACT_PREFIX) \
                                     or read_address2user(address=address, cur=cur):
                                 # 必要なAddressのみ
                                 self.db.write_address_idx(address, tx.hash, index, coin_id, amount, False)
+                                self.db.write_unspent(address, tx.hash, index, coin_id, amount, tx.height, tx.type)
                         # TXの種類による追加操作
                         if tx.type == C.TX_GENESIS:
                             pass
@@ -710,62 +1378,138 @@ class ChainBuilder:
                             dummy, c_method, redeem_address, c_args = bjson.loads(start_tx.message)
                             self.db.write_contract(c_address=c_address, start_tx=start_tx,
                                                    finish_hash=tx.hash, message=(c_method, c_args, c_storage))
+                    self.db.undo_end(block.height)
+                    if block.height > config['undo_depth']:
+                        self.db.delete_undo(block.height - config['undo_depth'])
 
                 # block挿入終了
-                self.best_chain = best_chain
-                self.root_block = block
-                self.db.batch_commit()
+                with self.db.commit_lock:
+                    self.best_chain = best_chain
+                    self.root_block = block
+                    self.db.batch_commit()
+                    self.db.headers.append(batched_blocks)
+                    for block in batched_blocks:
+                        self.best_chain_index.pop(block.height, None)
                 self.save_starter()
                 # root_blockよりHeightの小さいBlockを消す
-                for blockhash, block in self.chain.copy().items():
-                    if self.root_block.height >= block.height:
-                        del self.chain[blockhash]
+                removed = [blockhash for blockhash, block in self.chain.items()
+                           if self.root_block.height >= block.height]
+                for blockhash in removed:
+                    del self.chain[blockhash]
+                self._cut_chain_score(removed)
                 logging.debug("Success batch {} blocks, root={}."
                               .format(len(batched_blocks), self.root_block))
                 # アカウントへ反映↓
                 user_account.new_batch_apply(batched_blocks)
+                self.start_prune()
                 return batched_blocks  # [<height=n>, <height=n+1>, .., <height=n+m>]
             except Exception as e:
                 self.db.batch_rollback()
                 logging.warning("Failed batch block builder. '{}'".format(e), exc_info=True)
                 return list()
 
+    def start_prune(self):
+        if self.prune_depth is None:
+            return
+        elif self.prune_thread and self.prune_thread.is_alive():
+            return
+        self.prune_thread = threading.Thread(target=self._prune_loop, name='Prune', daemon=True)
+        self.prune_thread.start()
+
+    def _prune_loop(self):
+        while not P.F_STOP:
+            try:
+                if self.prune() == 0:
+                    return
+            except Exception as e:
+                logging.error("Failed prune. '{}'".format(e), exc_info=True)
+                return
+
+    def prune(self, limit=PRUNE_BATCH_BLOCKS):
+        """ prune old blocks by one batch, return pruned block count """
+        stop_height = min(self.root_block.height - self.prune_depth, self.pruned_height + limit)
+        if stop_height <= self.pruned_height:
+            return 0
+        self.db.batch_create()
+        try:
+            tx_count = 0
+            spent_height = None
+            with closing(create_db(V.DB_ACCOUNT_PATH)) as db:
+                cur = db.cursor()
+                for height in range(self.pruned_height + 1, stop_height + 1):
+                    block = self.db.read_block(self.db.read_block_hash(height))
+                    for tx in block.txs:
+                        if tx.type not in PRUNABLE_TX_TYPES:
+                            continue
+                        elif tx.message_type != C.MSG_NONE:
+                            continue  # contract start tx is transfer
+                        elif len(self.db.read_usedindex(tx.hash)) < len(tx.outputs):
+                            continue  # need for UTXO
+                        elif read_txhash2log(tx.hash, cur):
+                            continue  # need for user's balance on init
+                        if spent_height is None:
+                            # {txhash: last height},  spent by blocks which can rollback
+                            spent_height = {k: undo_height
+                                            for undo_height, records in self.db.read_undo_iter(stop_height + 1)
+                                            for name, k, v in records if name == '_used_index'}
+                        self.db.prune_tx(tx.hash, spent_height.get(tx.hash))
+                        tx_count += 1
+                    self.db.prune_block(block)
+            # cannot rollback to pruned height
+            for height in range(self.pruned_height, stop_height + 1):
+                self.db.delete_undo(height)
+            self.db.write_meta(b'pruned_height', stop_height.to_bytes(4, ITER_ORDER))
+            self.db.batch_commit()
+        except Exception:
+            self.db.batch_rollback()
+            raise
+        logging.debug("Pruned {} blocks {} txs to {} height."
+                      .format(stop_height - self.pruned_height, tx_count, stop_height))
+        count = stop_height - self.pruned_height
+        self.pruned_height = stop_height
+        return count
+
     def new_block(self, block):
         # とりあえず新規に挿入
         self.chain[block.hash] = block
+        self._connect_block(block)
         # BestChainの変化を調べる
-        new_best_block, new_best_chain = self.get_best_chain()
+        new_best_block = self._best_tip()
+        assert new_best_block, 'Cannot find best_block on new_block? chain={}'.format(list(self.chain))
         if self.best_block and new_best_block == self.best_block:
             return  # 操作を加える必要は無い
+        # 分岐点までのblockのみ調べる
+        old_best_chain = self.best_chain
+        new_branch, old_branch = self._fork_branches(new_best_block, self.best_block)
+        new_best_chain = new_branch + old_best_chain[len(old_branch):]
         # tx heightを合わせる
-        old_best_chain = self.best_chain.copy()
-        commons = set(new_best_chain) & set(old_best_chain)
-        for index, block in enumerate(old_best_chain):
-            if block not in commons:
-                try: old_best_chain[index+1].next_hash = None
-                except IndexError: pass
-                for tx in block.txs:
-                    tx.height = None
-                block.f_orphan = True
-        for index, block in enumerate(new_best_chain):
-            if block not in commons:
-                try: new_best_chain[index+1].next_hash = block.hash
-                except IndexError: pass
-                for tx in block.txs:
-                    tx.height = block.height
-                block.f_orphan = False
+        for index, block in enumerate(old_branch):
+            try: old_best_chain[index+1].next_hash = None
+            except IndexError: pass
+            if self.best_chain_index.get(block.height) == block.hash:
+                del self.best_chain_index[block.height]
+            for tx in block.txs:
+                tx.height = None
+            block.f_orphan = True
+        for index, block in enumerate(new_branch):
+            try: new_best_chain[index+1].next_hash = block.hash
+            except IndexError: pass
+            self.best_chain_index[block.height] = block.hash
+            for tx in block.txs:
+                tx.height = block.height
+            block.f_orphan = False
         # 変化しているので反映する
         self.best_block, self.best_chain = new_best_block, new_best_chain
         tx_builder.affect_new_chain(
-            new_best_chain=set(new_best_chain) - commons,
-            old_best_chain=set(old_best_chain) - commons)
+            new_best_chain=set(new_branch),
+            old_best_chain=set(old_branch))
 
     def get_block(self, blockhash):
         if blockhash in self.chain:
             # Memoryより
             block = self.chain[blockhash]
             block.f_on_memory = True
-            block.f_orphan = bool(block not in self.best_chain)
+            block.f_orphan = bool(self.best_chain_index.get(block.height) != block.hash)
         else:
             # DataBaseより
             block = self.db.read_block(blockhash)
@@ -776,44 +1520,363 @@ class ChainBuilder:
                 return None
         return block
 
+    def get_tx_position(self, tx):
+        # DataBase
+        position = self.db.read_tx_position(tx.hash)
+        if position is not None:
+            return position
+        # Memory
+        block = self.get_block(blockhash=self.get_block_hash(height=tx.height))
+        if block is None or tx not in block.txs:
+            return None
+        return block.txs.index(tx)
+
+    def get_header_iter(self, blockhash):
+        # yield height, hash, previous_hash, time, bits, flag from blockhash to genesis
+        # memory blocks first, after reach database use header table
+        while blockhash in self.chain:
+            block = self.chain[blockhash]
+            yield block.height, block.hash, block.previous_hash, block.time, block.bits, block.flag
+            blockhash = block.previous_hash
+        while True:
+            block = self.db.read_block(blockhash)
+            if block is None:
+                return
+            elif self.db.headers.get_hash(block.height) == blockhash:
+                break
+            # newer than header table
+            yield block.height, block.hash, block.previous_hash, block.time, block.bits, block.flag
+            blockhash = block.previous_hash
+        for height, blockhash, previous_hash, _time, bits, flag, work_hash in \
+                self.db.read_block_header_iter(stop_height=block.height, reverse=True):
+            yield height, blockhash, previous_hash, _time, bits, flag
+
     def get_block_hash(self, height):
         if height > self.best_block.height:
             return None
         elif height < 0:
             return None
         # Memory
-        for block in self.best_chain:
-            if height == block.height:
-                return block.hash
+        blockhash = self.best_chain_index.get(height)
+        if blockhash is not None:
+            return blockhash
         # DataBase
         return self.db.read_block_hash(height)
 
 
+def _unconfirmed_size(tx):
+    return tx.size + 96 * len(tx.signature)  # pk:32, sign:64
+
+
+class UnconfirmedTXs(dict):
+    """
+    unconfirmed txs {txhash: tx}, indexes are updated on set and delete
+    spent: {txhash: {txindex: {spender txhash,..}}}
+    address: {address: {txhash: None}} outputs to the address, insertion ordered
+    types: {tx_type: {txhash: None}} insertion ordered
+    fee_order: [(-gas_price, time, txhash),..] sorted, high fee first
+    limited by config "mempool_max_size" and "mempool_max_txs", low gas_price txs are evicted
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.RLock()
+        self.sequence = 0
+        self.order = dict()  # txhash: inserted sequence
+        self.spent = dict()
+        self.address = dict()
+        self.types = dict()
+        self.fee_order = list()
+        self.first_seen = dict()  # txhash: unix time
+        self.deadlines = list()  # heap [(deadline, txhash),..], removed txs are skipped
+        self.sizes = dict()  # txhash: size with signature
+        self.total_size = 0
+        self.floor_gas_price = 0  # raised by eviction
+        self.evicted = 0
+        self.rejected = 0
+
+    def __setitem__(self, txhash, tx):
+        with self.lock:
+            first_seen = self.first_seen.get(txhash) or time.time()
+            if txhash in self:
+                self.__delitem__(txhash)
+            super().__setitem__(txhash, tx)
+            self.first_seen[txhash] = first_seen
+            heapq.heappush(self.deadlines, (tx.deadline, txhash))
+            self.sequence += 1
+            self.order[txhash] = self.sequence
+            for _txhash, _txindex in tx.inputs:
+                self.spent.setdefault(_txhash, dict()).setdefault(_txindex, set()).add(txhash)
+            for address, coin_id, amount in tx.outputs:
+                self.address.setdefault(address, dict())[txhash] = None
+            self.types.setdefault(tx.type, dict())[txhash] = None
+            insort(self.fee_order, (-tx.gas_price, tx.time, txhash))
+            size = _unconfirmed_size(tx)
+            self.sizes[txhash] = size
+            self.total_size += size
+
+    def __delitem__(self, txhash):
+        with self.lock:
+            tx = super().pop(txhash)
+            del self.order[txhash]
+            for _txhash, _txindex in tx.inputs:
+                spenders = self.spent.get(_txhash, {}).get(_txindex)
+                if spenders is None:
+                    continue  # duplicated input
+                spenders.discard(txhash)
+                if len(spenders) == 0:
+                    del self.spent[_txhash][_txindex]
+                    if len(self.spent[_txhash]) == 0:
+                        del self.spent[_txhash]
+            for address, coin_id, amount in tx.outputs:
+                txs = self.address.get(address)
+                if txs is not None and txhash in txs:
+                    del txs[txhash]
+                    if len(txs) == 0:
+                        del self.address[address]
+            del self.types[tx.type][txhash]
+            del self.fee_order[bisect_left(self.fee_order, (-tx.gas_price, tx.time, txhash))]
+            self.total_size -= self.sizes.pop(txhash)
+            del self.first_seen[txhash]
+
+    def pop(self, txhash, *default):
+        with self.lock:
+            if txhash not in self:
+                if default:
+                    return default[0]
+                raise KeyError(txhash)
+            tx = self[txhash]
+            self.__delitem__(txhash)
+            return tx
+
+    def clear(self):
+        with self.lock:
+            super().clear()
+            self.order.clear()
+            self.spent.clear()
+            self.address.clear()
+            self.types.clear()
+            self.fee_order.clear()
+            self.first_seen.clear()
+            self.deadlines.clear()
+            self.sizes.clear()
+            self.total_size = 0
+
+    def merge_signature(self, tx):
+        # add signatures of same contract tx, False if not unconfirmed
+        with self.lock:
+            if tx.hash not in self:
+                return False
+            original_tx = self[tx.hash]
+            original_tx.signature = list(set(tx.signature) | set(original_tx.signature))
+            size = _unconfirmed_size(original_tx)
+            self.total_size += size - self.sizes[tx.hash]
+            self.sizes[tx.hash] = size
+            return True
+
+    def get_usedindex(self, txhash):
+        # {txindex,..} used by unconfirmed txs
+        with self.lock:
+            return set(self.spent.get(txhash, ()))
+
+    def is_usedindex(self, txhash, txindex, except_txhash=None):
+        with self.lock:
+            spenders = self.spent.get(txhash, {}).get(txindex, ())
+            return any(spender != except_txhash for spender in spenders)
+
+    def get_used_outpoints(self):
+        with self.lock:
+            return {(txhash, txindex) for txhash, indexes in self.spent.items() for txindex in indexes}
+
+    def get_address_txs(self, addresses):
+        # txs which have outputs to addresses, sorted by time
+        with self.lock:
+            txs = {txhash: self[txhash] for address in addresses for txhash in self.address.get(address, ())}
+            return sorted(txs.values(), key=lambda x: (x.time, self.order[x.hash]))
+
+    def get_type_txs(self, tx_type, stop_txhash=None, f_sort=True):
+        # txs of the type, sorted by time or insertion order
+        # txs after stop_txhash are excluded, stop_txhash may be other type
+        with self.lock:
+            if f_sort:
+                key = lambda x: (x.time, self.order[x.hash])
+            else:
+                key = lambda x: self.order[x.hash]
+            txs = sorted((self[txhash] for txhash in self.types.get(tx_type, ())), key=key)
+            if stop_txhash in self:
+                stop_key = key(self[stop_txhash])
+                txs = [tx for tx in txs if key(tx) < stop_key]
+        return txs
+
+    def get_fee_order_txs(self):
+        # high gas_price first, old first on same gas_price
+        with self.lock:
+            return [self[txhash] for dummy, dummy, txhash in self.fee_order]
+
+    def get_dependents(self, txhash):
+        # unconfirmed txs which spend outputs of txhash, recursively
+        dependents = list()
+        check = [txhash]
+        with self.lock:
+            while len(check) > 0:
+                for spenders in self.spent.get(check.pop(), {}).values():
+                    for spender in spenders:
+                        if spender not in dependents:
+                            dependents.append(spender)
+                            check.append(spender)
+        return dependents
+
+    def get_conflicts(self, outpoints):
+        # unconfirmed txs which spend the outpoints, and their dependents
+        conflicts = list()
+        with self.lock:
+            for txhash, txindex in outpoints:
+                for spender in tuple(self.spent.get(txhash, {}).get(txindex, ())):
+                    if spender in conflicts:
+                        continue
+                    conflicts.append(spender)
+                    conflicts.extend(_txhash for _txhash in self.get_dependents(spender) if _txhash not in conflicts)
+        return conflicts
+
+    def expire(self, limit):
+        # remove txs of deadline < limit by deadline order, return removed txs
+        expired = list()
+        with self.lock:
+            while len(self.deadlines) > 0 and self.deadlines[0][0] < limit:
+                deadline, txhash = heapq.heappop(self.deadlines)
+                if txhash in self and self[txhash].deadline == deadline:
+                    expired.append(self.pop(txhash))
+            if len(self.deadlines) > len(self) * 2 + 1000:
+                # too many entries of removed txs
+                self.deadlines = [(tx.deadline, txhash) for txhash, tx in self.items()]
+                heapq.heapify(self.deadlines)
+        if expired:
+            logging.debug("Expire {} unconfirmed txs.".format(len(expired)))
+        return expired
+
+    def is_full(self, ratio=1.0):
+        return config['mempool_max_size'] * ratio < self.total_size or \
+            config['mempool_max_txs'] * ratio < len(self)
+
+    def min_gas_price(self):
+        # floor is released when half of limit is free
+        if self.floor_gas_price and not self.is_full(0.5):
+            self.floor_gas_price = 0
+        return self.floor_gas_price
+
+    def is_acceptable(self, tx):
+        # admission control of new tx, rejected is counted
+        if tx.hash in self or self.min_gas_price() <= tx.gas_price:
+            return True
+        self.rejected += 1
+        return False
+
+    def evict(self):
+        # remove lowest gas_price txs and dependents until under limit, return removed txs
+        evicted = list()
+        with self.lock:
+            while len(self.fee_order) > 0 and self.is_full():
+                gas_price, dummy, txhash = self.fee_order[-1]
+                self.floor_gas_price = max(self.floor_gas_price, -gas_price + 1)
+                for _txhash in [txhash] + self.get_dependents(txhash):
+                    if _txhash in self:
+                        evicted.append(self.pop(_txhash))
+            self.evicted += len(evicted)
+        if evicted:
+            logging.info("Evict {} unconfirmed txs, min gas_price {}."
+                         .format(len(evicted), self.floor_gas_price))
+        return evicted
+
+    def getinfo(self):
+        return {
+            'txs': len(self),
+            'size': self.total_size,
+            'max_txs': config['mempool_max_txs'],
+            'max_size': config['mempool_max_size'],
+            'min_gas_price': self.min_gas_price(),
+            'evicted': self.evicted,
+            'rejected': self.rejected}
+
+
 class TransactionBuilder:
     def __init__(self):
         # BLockに存在するTXのみ保持すればよい
-        self.unconfirmed = dict()  # Blockに取り込まれた事のないTX、参照保持用
+        self.unconfirmed = UnconfirmedTXs()  # Blockに取り込まれた事のないTX、参照保持用
         self.chained_tx = weakref.WeakValueDictionary()  # 一度でもBlockに取り込まれた事のあるTX
-        self.tmp = weakref.WeakValueDictionary()  # 一時的
 
     def put_unconfirmed(self, tx, outer_cur=None):
+        """ return True if tx is in unconfirmed """
         assert tx.height is None, 'Not unconfirmed tx {}'.format(tx)
         if tx.type in (C.TX_POW_REWARD, C.TX_POS_REWARD):
-            return  # It is Reword tx
+            return False  # It is Reword tx
         elif tx.hash in self.unconfirmed:
             logging.debug('Already unconfirmed tx. {}'.format(tx))
-            return
-        self.unconfirmed[tx.hash] = tx
-        if tx.hash in self.chained_tx:
+            return True
+        elif tx.hash in self.chained_tx:
             logging.debug('Already chained tx. {}'.format(tx))
-            return
+            return False
+        self.unconfirmed[tx.hash] = tx
+        self.evict_unconfirmed()
+        if tx.hash not in self.unconfirmed:
+            logging.debug('Evicted new tx. {}'.format(tx))
+            return False
         user_account.affect_new_tx(tx, outer_cur)
         NewInfo.put(obj=tx)
+        return True
+
+    def remove_unconfirmed(self, txhash):
+        # remove from unconfirmed and user's unconfirmed movement
+        self.unconfirmed.pop(txhash, None)
+        user_account.memory_movement.pop(txhash, None)
+
+    def evict_unconfirmed(self):
+        for tx in self.unconfirmed.evict():
+            self.remove_unconfirmed(tx.hash)
+
+    def save_unconfirmed(self, dirs):
+        # dump on clean shutdown, first seen order
+        if os.path.exists(os.path.join(dirs, MEMPOOL_FILE_NAME)):
+            # closed on booting, saved txs are not loaded yet
+            logging.info("Keep {} not loaded yet.".format(MEMPOOL_FILE_NAME))
+            return
+        with self.unconfirmed.lock:
+            txs = sorted(self.unconfirmed.values(),
+                         key=lambda x: (self.unconfirmed.first_seen[x.hash], self.unconfirmed.order[x.hash]))
+            records = [encode_mempool_record(tx, self.unconfirmed.first_seen[tx.hash]) for tx in txs]
+        tmp_path = os.path.join(dirs, MEMPOOL_FILE_NAME + '.tmp')
+        with open(tmp_path, mode='bw') as fp:
+            fp.write(MEMPOOL_MAGIC)
+            for b in records:
+                fp.write(b)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, os.path.join(dirs, MEMPOOL_FILE_NAME))
+        logging.info("Save {} unconfirmed txs.".format(len(records)))
+
+    def read_unconfirmed_iter(self, dirs):
+        # yield (tx, first_seen) saved by save_unconfirmed, file is removed after read
+        path = os.path.join(dirs, MEMPOOL_FILE_NAME)
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, mode='br') as fp:
+                if fp.read(len(MEMPOOL_MAGIC)) == MEMPOOL_MAGIC:
+                    for b in _read_record_iter(fp):
+                        try:
+                            tx, first_seen = decode_mempool_record(b)
+                        except Exception as e:
+                            logging.warning("Ignore broken record of {} by \"{}\"".format(MEMPOOL_FILE_NAME, e))
+                            continue
+                        yield tx, first_seen
+                else:
+                    logging.warning("Unknown format {}, ignore.".format(MEMPOOL_FILE_NAME))
+        except OSError as e:
+            logging.warning("Failed read {} by \"{}\"".format(MEMPOOL_FILE_NAME, e))
+        finally:
+            os.remove(path)
 
     def get_tx(self, txhash, default=None):
-        if txhash in self.tmp:
-            return self.tmp[txhash]
-        elif txhash in self.unconfirmed:
+        if txhash in self.unconfirmed:
             # unconfirmedより
             tx = self.unconfirmed[txhash]
             tx.f_on_memory = True
@@ -828,21 +1891,31 @@ class TransactionBuilder:
             tx = builder.db.read_tx(txhash)
             if tx:
                 tx.f_on_memory = False
-                self.tmp[txhash] = tx
             else:
                 return default
         return tx
 
+    def get_txs(self, hashes, default=None):
+        # [tx or default,..] same order as hashes, database txs are read at once
+        result = dict()
+        missing = list()
+        for txhash in hashes:
+            if txhash in self.unconfirmed or txhash in self.chained_tx:
+                result[txhash] = self.get_tx(txhash, default)
+            else:
+                missing.append(txhash)
+        for txhash, tx in zip(missing, builder.db.read_txs(missing)):
+            if tx:
+                tx.f_on_memory = False
+                result[txhash] = tx
+            else:
+                result[txhash] = default
+        return [result[txhash] for txhash in hashes]
+
     def __contains__(self, item):
         return bool(self.get_tx(item.hash))
 
     def affect_new_chain(self, old_best_chain, new_best_chain):
-        def input_check(_tx):
-            for input_hash, input_index in _tx.inputs:
-                if input_index in builder.db.read_usedindex(input_hash):
-                    return True
-            return False
-
         # 状態を戻す
         for block in old_best_chain:
             for tx in block.txs:
@@ -851,30 +1924,25 @@ class TransactionBuilder:
                 if tx.hash in self.chained_tx:
                     del self.chained_tx[tx.hash]
         # 新規に反映する
+        spent_outpoints = list()
         for block in new_best_chain:
             for tx in block.txs:
                 if tx.hash not in self.chained_tx:
                     self.chained_tx[tx.hash] = tx
                 if tx.hash in self.unconfirmed:
                     del self.unconfirmed[tx.hash]
+                spent_outpoints.extend(tx.inputs)
 
-        # delete expired unconfirmed txs
-        limit = int(time.time() - V.BLOCK_GENESIS_TIME - C.ACCEPT_MARGIN_TIME)
-        for txhash, tx in self.unconfirmed.copy().items():
-            if P.F_NOW_BOOTING:
-                break  # not delete on booting..
-            # Remove expired unconfirmed tx
-            if limit > tx.deadline:
-                del self.unconfirmed[txhash]
-                continue
-            # Remove tx include by both best_chain & unconfirmed
-            if txhash in self.chained_tx:
-                del self.unconfirmed[txhash]
-                continue
-            # check inputs usedindex on only database
-            if input_check(tx):
-                del self.unconfirmed[txhash]
-                continue
+        # remove unconfirmed txs which use same inputs with new chain
+        for txhash in self.unconfirmed.get_conflicts(spent_outpoints):
+            self.remove_unconfirmed(txhash)
+        # delete expired unconfirmed txs, not delete on booting..
+        if not P.F_NOW_BOOTING:
+            limit = int(time.time() - V.BLOCK_GENESIS_TIME - C.ACCEPT_MARGIN_TIME)
+            for tx in self.unconfirmed.expire(limit):
+                self.remove_unconfirmed(tx.hash)
+        # txs of old chain may over limit
+        self.evict_unconfirmed()
 
 
 class UserAccount:
@@ -888,9 +1956,11 @@ class UserAccount:
         with closing(create_db(V.DB_ACCOUNT_PATH)) as db:
             cur = db.cursor()
             memory_sum = Accounting()
-            for move_log in read_log_iter(cur):
+            move_logs = list(read_log_iter(cur))
+            txs = builder.db.read_txs([move_log.txhash for move_log in move_logs])
+            for move_log, tx in zip(move_logs, txs):
                 # logに記録されてもBlockに取り込まれていないならTXは存在せず
-                if builder.db.read_tx(move_log.txhash):
+                if tx:
                     memory_sum += move_log.movement
                 else:
                     logging.debug("It's unknown log {}".format(move_log))
@@ -1002,6 +2072,16 @@ class UserAccount:
                 else:
                     yield move_log.get_tuple_data()
 
+    def verified_batch_apply(self, stop_height):
+        # same as new_batch_apply of blocks to stop_height, but read user's logs only
+        with closing(create_db(V.DB_ACCOUNT_PATH)) as db:
+            cur = db.cursor()
+            move_logs = list(read_log_iter(cur))
+        txs = builder.db.read_txs([move_log.txhash for move_log in move_logs])
+        for move_log, tx in zip(move_logs, txs):
+            if tx and tx.height is not None and tx.height <= stop_height:
+                self.db_balance += move_log.movement
+
     def new_batch_apply(self, batched_blocks):
         with closing(create_db(V.DB_ACCOUNT_PATH)) as db:
             cur = db.cursor()
@@ -190,11 +190,8 @@ def contract_fill(c: Contract, best_block=None, best_chain=None, stop_txhash=Non
     # unconfirmed (check validator condition satisfied)
     if best_block is None:
         unconfirmed = list()
-        for conclude_tx in tuple(tx_builder.unconfirmed.values()):
-            if conclude_tx.hash == stop_txhash:
-                break
-            if conclude_tx.type != C.TX_CONCLUDE_CONTRACT:
-                continue
+        for conclude_tx in tx_builder.unconfirmed.get_type_txs(
+                C.TX_CONCLUDE_CONTRACT, stop_txhash=stop_txhash, f_sort=False):
             c_address, start_hash, c_storage = decode(conclude_tx.message)
             if c_address != c.c_address:
                 continue
@@ -256,11 +253,7 @@ def get_conclude_by_start_iter(c_address, start_hash, best_block=None, best_chai
                 yield tx.hash
     # unconfirmed
     if best_block is None:
-        for tx in sorted(tx_builder.unconfirmed.values(), key=lambda x: x.time):
-            if tx.hash == stop_txhash:
-                raise StopIteration
-            if tx.type != C.TX_CONCLUDE_CONTRACT:
-                continue
+        for tx in tx_builder.unconfirmed.get_type_txs(C.TX_CONCLUDE_CONTRACT, stop_txhash=stop_txhash):
             _c_address, _start_hash, c_storage = decode(tx.message)
             if _c_address != c_address:
                 continue
@@ -272,12 +265,10 @@ def get_conclude_by_start_iter(c_address, start_hash, best_block=None, best_chai
 def start_tx2index(start_hash=None, start_tx=None):
     if start_hash:
         start_tx = tx_builder.get_tx(txhash=start_hash)
-    block = builder.get_block(blockhash=builder.get_block_hash(height=start_tx.height))
-    if block is None:
-        raise BlockChainError('Not found block of start_tx included? {}'.format(start_tx))
-    if start_tx not in block.txs:
-        raise BlockChainError('Not found start_tx in block? {}'.format(block))
-    return start_tx.height * 0xffffffff + block.txs.index(start_tx)
+    position = builder.get_tx_position(tx=start_tx)
+    if position is None:
+        raise BlockChainError('Not found start_tx in block? {}'.format(start_tx))
+    return start_tx.height * 0xffffffff + position
 
 
 def update_contract_cashe():
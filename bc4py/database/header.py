@@ -0,0 +1,150 @@
+import struct
+import mmap
+import os
+import threading
+import logging
+
+# height => hash, previous_hash, time, bits, flag, work_hash
+struct_header = struct.Struct('>32s32sIIB32s')
+HEADER_FILE_NAME = 'headers.dat'
+
+
+class HeaderTable:
+    """
+    append only file of fixed size header records, record offset is height
+    memory-mapped for reading, written by ChainBuilder.batch_apply after commit
+    """
+
+    def __init__(self, dirs):
+        self.path = os.path.join(dirs, HEADER_FILE_NAME)
+        if not os.path.exists(self.path):
+            open(self.path, mode='bw').close()
+        self.fp = open(self.path, mode='r+b')
+        self.lock = threading.Lock()
+        self.map_lock = threading.Lock()  # readers of mm and truncate
+        self.mm = None
+        self.height = -1  # last recorded height
+        size = os.path.getsize(self.path)
+        if size % struct_header.size:
+            # cut broken last record
+            self.fp.truncate(size - size % struct_header.size)
+            logging.warning("Remove broken last record of {}.".format(HEADER_FILE_NAME))
+        self._remap()
+
+    def __len__(self):
+        return self.height + 1
+
+    def close(self):
+        with self.lock:
+            self.mm = None
+            self.fp.close()
+
+    def _remap(self):
+        # do not close old mmap, other threads may read it
+        size = os.path.getsize(self.path)
+        self.height = size // struct_header.size - 1
+        if size == 0:
+            self.mm = None
+        else:
+            self.mm = mmap.mmap(self.fp.fileno(), size, access=mmap.ACCESS_READ)
+
+    def get(self, height):
+        # (hash, previous_hash, time, bits, flag, work_hash) or None
+        with self.map_lock:
+            mm = self.mm
+            if mm is None or height < 0 or len(mm) < (height + 1) * struct_header.size:
+                return None
+            return struct_header.unpack_from(mm, height * struct_header.size)
+
+    def get_hash(self, height):
+        with self.map_lock:
+            mm = self.mm
+            if mm is None or height < 0 or len(mm) < (height + 1) * struct_header.size:
+                return None
+            idx = height * struct_header.size
+            return mm[idx:idx+32]
+
+    def iter_range(self, start_height=0, stop_height=None, reverse=False, chunk=1000):
+        # yield height, hash, previous_hash, time, bits, flag, work_hash
+        # records are copied by chunk, mm may be truncated while iterating
+        with self.map_lock:
+            if self.mm is None:
+                return
+            last_height = len(self.mm) // struct_header.size - 1
+        if stop_height is None or stop_height > last_height:
+            stop_height = last_height
+        start_height = max(0, start_height)
+        starts = range(start_height, stop_height + 1, chunk)
+        for start in reversed(starts) if reverse else starts:
+            with self.map_lock:
+                if self.mm is None:
+                    return
+                b = self.mm[start * struct_header.size:(min(start + chunk - 1, stop_height) + 1) * struct_header.size]
+            heights = range(start, start + len(b) // struct_header.size)
+            for height in reversed(heights) if reverse else heights:
+                yield (height,) + struct_header.unpack_from(b, (height - start) * struct_header.size)
+
+    def append(self, blocks):
+        # blocks: [<height=n>, <height=n+1>, ..]
+        with self.lock:
+            if len(blocks) == 0:
+                return
+            if blocks[0].height != self.height + 1:
+                # overwrite from the height (after rollback)
+                self._truncate(blocks[0].height - 1)
+            self.fp.seek(0, os.SEEK_END)
+            for block in blocks:
+                assert block.height == self.height + 1, 'Not continuous header {}!={}+1'\
+                    .format(block.height, self.height)
+                self.fp.write(struct_header.pack(block.hash, block.previous_hash, block.time,
+                                                 block.bits, block.flag, block.work_hash))
+                self.height += 1
+            self.fp.flush()
+            os.fsync(self.fp.fileno())
+            self._remap()
+
+    def truncate(self, height):
+        # remove records higher than height
+        with self.lock:
+            self._truncate(height)
+
+    def _truncate(self, height):
+        if height >= self.height:
+            return
+        with self.map_lock:
+            # readers use mm under map_lock only, so closing is safe
+            if self.mm is not None:
+                # cannot truncate mapped file on Windows
+                self.mm.close()
+                self.mm = None
+            self.fp.truncate((height + 1) * struct_header.size)
+            self.fp.flush()
+            self._remap()
+        logging.debug("Truncate header table to {} height.".format(height))
+
+
+def rebuild_header_table(db, start_height=0):
+    """ rebuild header table of DataBase from "_block_index" table """
+    headers = db.headers
+    headers.truncate(start_height - 1)
+    blocks = list()
+    for height, blockhash in db.read_block_hash_iter(start_height=start_height, f_header=False):
+        block = db.read_block(blockhash)
+        if block is None:
+            logging.warning("Not found block {} on rebuild header table.".format(height))
+            break
+        elif block.work_hash is None:
+            block.update_pow()
+        blocks.append(block)
+        if len(blocks) >= 5000:
+            headers.append(blocks)
+            blocks.clear()
+    headers.append(blocks)
+    logging.info("Rebuild header table to {} height.".format(headers.height))
+
+
+__all__ = [
+    "struct_header",
+    "HeaderTable",
+    "rebuild_header_table",
+]
@@ -0,0 +1,172 @@
+from bc4py.chain.tx import TX
+from bc4py.database.builder import database_prefix, DB_VERSION, ITER_ORDER, struct_block, struct_tx, \
+    struct_address_idx, struct_unspent
+from bc4py.database.backend import create_backend
+import struct
+import os
+import shutil
+import logging
+
+# directory name of each table on db-ver0 (one LevelDB per table)
+ver0_dirs = {
+    "_block": "block",
+    "_tx": "tx",
+    "_used_index": "used-index",
+    "_block_index": "block-index",
+    "_address_index": "address-index",
+    "_coins": "coins",
+    "_contract": "contract",
+    "_validator": "validator",
+}
+MIGRATE_BATCH_SIZE = 5000
+
+
+def _iter_prefix(db, prefix):
+    # next prefix itself is not a key
+    return db.iterator(start=prefix, stop=bytes([prefix[0] + 1]))
+
+
+def _copy_starter_files(old_dirs, new_dirs):
+    for file_name in os.listdir(old_dirs):
+        if file_name.startswith('starter.'):
+            shutil.copy2(os.path.join(old_dirs, file_name), os.path.join(new_dirs, file_name))
+
+
+def migrate_ver0_to_ver1(old_dirs, new_dirs):
+    """ ver0 => ver1: eight LevelDBs to one prefixed LevelDB """
+    os.mkdir(new_dirs)
+    new_db = create_backend(os.path.join(new_dirs, 'chain'), create_if_missing=True)
+    for name, dir_name in ver0_dirs.items():
+        old_db = create_backend(os.path.join(old_dirs, dir_name), create_if_missing=False)
+        prefix = database_prefix[name]
+        items = list()
+        count = 0
+        for k, v in old_db.iterator():
+            items.append((prefix + bytes(k), bytes(v)))
+            if len(items) >= MIGRATE_BATCH_SIZE:
+                new_db.write(items)
+                count += len(items)
+                items.clear()
+        new_db.write(items, sync=True)
+        count += len(items)
+        old_db.close()
+        logging.info("Migrate table {} {} records.".format(name, count))
+    new_db.close()
+    _copy_starter_files(old_dirs, new_dirs)
+
+
+def rebuild_coins_count(db):
+    """ rebuild next index of each coin_id from "_coins" table (for reindex) """
+    coins_prefix = database_prefix['_coins']
+    count = dict()
+    for k, v in _iter_prefix(db, coins_prefix):
+        # KEY: [prefix]-[coin_id uint4]-[index uint4]
+        k = bytes(k)
+        b_coin_id, index = k[1:5], int.from_bytes(k[5:9], ITER_ORDER)
+        count[b_coin_id] = max(count.get(b_coin_id, 0), index + 1)
+    count_prefix = database_prefix['_coins_count']
+    db.write([(count_prefix + b_coin_id, index.to_bytes(4, ITER_ORDER))
+                     for b_coin_id, index in count.items()], sync=True)
+    logging.info("Rebuild coins count {} coins.".format(len(count)))
+
+
+def _add_tx_position(db):
+    """ add position in block to "_tx" record """
+    old_struct_tx = struct.Struct('>4I')
+    block_prefix = database_prefix['_block']
+    tx_prefix = database_prefix['_tx']
+    items = list()
+    count = 0
+    for k, v in _iter_prefix(db, block_prefix):
+        v = bytes(v)
+        idx = struct_block.size
+        for position in range((len(v) - idx) // 32):
+            txhash = v[idx+32*position:idx+32*position+32]
+            b = db.get(tx_prefix + txhash)
+            height, _time, bin_len, sign_len = old_struct_tx.unpack_from(b)
+            new_b = struct_tx.pack(height, position, _time, bin_len, sign_len) + b[old_struct_tx.size:]
+            items.append((tx_prefix + txhash, new_b))
+        if len(items) >= MIGRATE_BATCH_SIZE:
+            db.write(items)
+            count += len(items)
+            items.clear()
+    db.write(items, sync=True)
+    count += len(items)
+    logging.info("Migrate tx position {} records.".format(count))
+
+
+def _build_unspent(db):
+    """ add "_unspent" table from unused "_address_index" """
+    address_prefix = database_prefix['_address_index']
+    tx_prefix = database_prefix['_tx']
+    unspent_prefix = database_prefix['_unspent']
+    items = list()
+    count = 0
+    for k, v in _iter_prefix(db, address_prefix):
+        k, v = bytes(k), bytes(v)
+        coin_id, amount, f_used = struct_address_idx.unpack(v)
+        if f_used:
+            continue
+        # KEY: [prefix]-[address 40s]-[txhash 32s]-[index uint1]
+        txhash = k[41:73]
+        b = db.get(tx_prefix + txhash)
+        height, position, _time, bin_len, sign_len = struct_tx.unpack_from(b)
+        tx = TX(binary=b[struct_tx.size:struct_tx.size+bin_len])
+        items.append((unspent_prefix + k[1:], struct_unspent.pack(coin_id, amount, height, tx.type)))
+        if len(items) >= MIGRATE_BATCH_SIZE:
+            db.write(items)
+            count += len(items)
+            items.clear()
+    db.write(items, sync=True)
+    count += len(items)
+    logging.info("Migrate unspent {} records.".format(count))
+
+
+def migrate_ver1_to_ver2(old_dirs, new_dirs):
+    """ ver1 => ver2: add "_coins_count" and "_unspent" tables, position in block to "_tx" record """
+    shutil.copytree(old_dirs, new_dirs)
+    db = create_backend(os.path.join(new_dirs, 'chain'), create_if_missing=False)
+    rebuild_coins_count(db)
+    # unspent record has height of tx, read by new "_tx" format
+    _add_tx_position(db)
+    _build_unspent(db)
+    db.close()
+
+
+# version => migrate function to the next version
+migrate_steps = {
+    0: migrate_ver0_to_ver1,
+    1: migrate_ver1_to_ver2,
+}
+
+
+def migrate_database(home_dir):
+    """
+    convert the newest older database to DB_VERSION
+    return True if migrated, False if nothing to migrate
+    """
+    for version in reversed(range(DB_VERSION)):
+        old_dirs = os.path.join(home_dir, 'db-ver{}'.format(version))
+        if os.path.exists(old_dirs):
+            break
+    else:
+        return False
+    logging.info("Start database migration from ver{} to ver{}.".format(version, DB_VERSION))
+    while version < DB_VERSION:
+        new_dirs = os.path.join(home_dir, 'db-ver{}'.format(version+1))
+        tmp_dirs = new_dirs + '.tmp'
+        if os.path.exists(tmp_dirs):
+            shutil.rmtree(tmp_dirs)
+        migrate_steps[version](old_dirs, tmp_dirs)
+        os.rename(tmp_dirs, new_dirs)
+        logging.info("Finish migration ver{} to ver{}, you can remove {}"
+                     .format(version, version+1, old_dirs))
+        old_dirs = new_dirs
+        version += 1
+    return True
+
+
+__all__ = [
+    "rebuild_coins_count",
+    "migrate_database",
+]
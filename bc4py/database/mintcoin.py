@@ -119,11 +119,7 @@ def fill_mintcoin_status(m, best_block=None, best_chain=None, stop_txhash=None):
             m.update(params=params, setting=setting, txhash=tx.hash)
     # unconfirmed
     if best_block is None:
-        for tx in sorted(tx_builder.unconfirmed.values(), key=lambda x: x.time):
-            if tx.hash == stop_txhash:
-                return
-            if tx.type != C.TX_MINT_COIN:
-                continue
+        for tx in tx_builder.unconfirmed.get_type_txs(C.TX_MINT_COIN, stop_txhash=stop_txhash):
             coin_id, params, setting = decode(tx.message)
             if coin_id != m.coin_id:
                 continue
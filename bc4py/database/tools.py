@@ -28,28 +28,34 @@ def _get_best_chain_all(best_block):
 
 def get_utxo_iter(target_address, best_block=None, best_chain=None):
     assert isinstance(target_address, set), 'TargetAddress is set.'
-    failed = 0
-    while failed < 20:
-        best_chain = best_chain or _get_best_chain_all(best_block)
-        if best_chain:
-            break
-        failed += 1
-        sleep(0.05)
-    else:
-        raise BlockChainError('Cannot get best_chain by {}'.format(best_block))
-    allow_mined_height = best_chain[0].height - C.MATURE_HEIGHT
-    # DataBaseより
-    for address in target_address:
-        for dummy, txhash, txindex, coin_id, amount, f_used in builder.db.read_address_idx_iter(address):
-            if f_used is False:
-                if txindex in get_usedindex(txhash=txhash, best_block=best_block, best_chain=best_chain):
-                    continue  # Used
-                tx = tx_builder.get_tx(txhash)
-                if tx.type in (C.TX_POW_REWARD, C.TX_POS_REWARD):
-                    if tx.height is not None and tx.height < allow_mined_height:
-                        yield address, tx.height, txhash, txindex, coin_id, amount
-                else:
-                    yield address, tx.height, txhash, txindex, coin_id, amount
+    # database and memory chain are read from same snapshot
+    with builder.db.read_view() as view:
+        failed = 0
+        while failed < 20:
+            if best_chain is None and best_block is None:
+                best_chain = view.best_chain
+            best_chain = best_chain or _get_best_chain_all(best_block)
+            if best_chain:
+                break
+            failed += 1
+            sleep(0.05)
+        else:
+            raise BlockChainError('Cannot get best_chain by {}'.format(best_block))
+        allow_mined_height = best_chain[0].height - C.MATURE_HEIGHT
+        # DataBaseより
+        db_unspents = list()
+        for address in target_address:
+            for dummy, txhash, txindex, coin_id, amount, height, tx_type in builder.db.read_unspent_iter(address):
+                db_unspents.append((address, txhash, txindex, coin_id, amount, height, tx_type))
+    memory_used = _get_used_outpoints_memory(best_block=best_block, best_chain=best_chain)
+    for address, txhash, txindex, coin_id, amount, height, tx_type in db_unspents:
+        if (txhash, txindex) in memory_used:
+            continue  # Used
+        if tx_type in (C.TX_POW_REWARD, C.TX_POS_REWARD):
+            if height < allow_mined_height:
+                yield address, height, txhash, txindex, coin_id, amount
+        else:
+            yield address, height, txhash, txindex, coin_id, amount
     # Memoryより
     for block in reversed(best_chain):
         for tx in block.txs:
@@ -65,7 +71,7 @@ def get_utxo_iter(target_address, best_block=None, best_chain=None):
                         yield address, tx.height, tx.hash, index, coin_id, amount
     # Unconfirmedより
     if best_block is None:
-        for tx in sorted(tx_builder.unconfirmed.values(), key=lambda x: x.time):
+        for tx in tx_builder.unconfirmed.get_address_txs(target_address):
             used_index = get_usedindex(txhash=tx.hash, best_block=best_block, best_chain=best_chain)
             for index, (address, coin_id, amount) in enumerate(tx.outputs):
                 if index in used_index:
@@ -86,6 +92,13 @@ def get_unspents_iter(outer_cur=None, best_chain=None):
 
 
 def get_usedindex(txhash, best_block=None, best_chain=None):
+    usedindex = _get_usedindex_memory(txhash=txhash, best_block=best_block, best_chain=best_chain)
+    # DataBaseより
+    usedindex.update(builder.db.read_usedindex(txhash))
+    return usedindex
+
+
+def _get_usedindex_memory(txhash, best_block=None, best_chain=None):
     assert builder.best_block, 'Not DataBase init.'
     best_chain = best_chain or _get_best_chain_all(best_block)
     # Memoryより
@@ -97,17 +110,25 @@ def get_usedindex(txhash, best_block=None, best_chain=None):
             for _txhash, _txindex in tx.inputs:
                 if _txhash == txhash:
                     usedindex.add(_txindex)
-    # DataBaseより
-    usedindex.update(builder.db.read_usedindex(txhash))
     # unconfirmedより
     if best_block is None:
-        for tx in list(tx_builder.unconfirmed.values()):
-            for _txhash, _txindex in tx.inputs:
-                if _txhash == txhash:
-                    usedindex.add(_txindex)
+        usedindex.update(tx_builder.unconfirmed.get_usedindex(txhash))
     return usedindex
 
 
+def _get_used_outpoints_memory(best_block=None, best_chain=None):
+    # {(txhash, txindex),..} used on memory chain and unconfirmed
+    used = set()
+    for block in best_chain:
+        if best_block and block == best_block:
+            continue
+        for tx in block.txs:
+            used.update((txhash, txindex) for txhash, txindex in tx.inputs)
+    if best_block is None:
+        used.update(tx_builder.unconfirmed.get_used_outpoints())
+    return used
+
+
 def is_usedindex(txhash, txindex, except_txhash, best_block=None, best_chain=None):
     assert builder.best_block, 'Not DataBase init.'
     best_chain = best_chain or _get_best_chain_all(best_block)
@@ -124,12 +145,8 @@ def is_usedindex(txhash, txindex, except_txhash, best_block=None, best_chain=Non
         return True
     # unconfirmedより
     if best_block is None:
-        for tx in tx_builder.unconfirmed.values():
-            if tx.hash == except_txhash:
-                continue
-            for _txhash, _txindex in tx.inputs:
-                if _txhash == txhash and _txindex == txindex:
-                    return True
+        if tx_builder.unconfirmed.is_usedindex(txhash, txindex, except_txhash):
+            return True
     return False
 
 
@@ -98,11 +98,7 @@ def validator_fill(v: Validator, best_block=None, best_chain=None, stop_txhash=N
             v.update(db_index=index, flag=flag, address=address, sig_diff=sig_diff, txhash=tx.hash)
     # unconfirmed
     if best_block is None:
-        for tx in sorted(tx_builder.unconfirmed.values(), key=lambda x: x.time):
-            if tx.hash == stop_txhash:
-                return
-            if tx.type != C.TX_VALIDATOR_EDIT:
-                continue
+        for tx in tx_builder.unconfirmed.get_type_txs(C.TX_VALIDATOR_EDIT, stop_txhash=stop_txhash):
             c_address, address, flag, sig_diff = decode(tx.message)
             if c_address != v.c_address:
                 continue
@@ -125,12 +121,10 @@ def get_validator_object(c_address, best_block=None, best_chain=None, stop_txhas
 def validator_tx2index(txhash=None, tx=None):
     if txhash:
         tx = tx_builder.get_tx(txhash=txhash)
-    block = builder.get_block(blockhash=builder.get_block_hash(height=tx.height))
-    if block is None:
-        raise BlockChainError('Not found block of start_tx included? {}'.format(tx))
-    if tx not in block.txs:
-        raise BlockChainError('Not found start_tx in block? {}'.format(block))
-    return tx.height * 0xffffffff + block.txs.index(tx)
+    position = builder.get_tx_position(tx=tx)
+    if position is None:
+        raise BlockChainError('Not found tx in block? {}'.format(tx))
+    return tx.height * 0xffffffff + position
 
 
 def update_validator_cashe():
@@ -0,0 +1,229 @@
+from bc4py.config import V
+from bc4py.database.builder import DataBase, database_tuple, database_prefix, config, \
+    struct_address, struct_address_idx
+from bc4py.database.backend import create_backend, default_backend
+from time import time
+import os
+import shutil
+import logging
+import psutil
+import tracemalloc
+
+
+def _disk_write_bytes():
+    try:
+        return psutil.Process().io_counters().write_bytes
+    except (AttributeError, psutil.Error):
+        return 0  # not supported platform
+
+
+def _open_database(work_dir, backend):
+    # DataBase on work_dir, return with original settings
+    original = (V.DB_HOME_DIR, config['backend'])
+    V.DB_HOME_DIR = work_dir
+    db = DataBase(backend=backend or default_backend)
+    return db, original
+
+
+def _reopen_database(db):
+    # reopen to drop memtable and block cashe
+    if db._db.name == 'memory':
+        return db
+    db.close()
+    return DataBase()
+
+
+def _close_database(db, original):
+    db.close()
+    V.DB_HOME_DIR, config['backend'] = original
+
+
+def _report(name, spans, write_bytes):
+    spans = sorted(spans)
+    r = {
+        'commits': len(spans),
+        'total(Sec)': round(sum(spans), 4),
+        'average(mSec)': round(sum(spans) / len(spans) * 1000, 4),
+        'median(mSec)': round(spans[len(spans)//2] * 1000, 4),
+        'max(mSec)': round(spans[-1] * 1000, 4),
+        'disk_write(kb)': write_bytes // 1024}
+    logging.info("Benchmark {} {}".format(name, r))
+    return r
+
+
+def benchmark_db_commit(work_dir, commit_num=200, records=100, value_size=120, sync=True, backend=None):
+    """
+    compare batch_commit latency and disk I/O
+    old: eight LevelDBs, commit table by table
+    new: one prefixed LevelDB, commit once
+    """
+    if os.path.exists(work_dir):
+        raise FileExistsError('Use new directory for benchmark. {}'.format(work_dir))
+    os.makedirs(work_dir)
+    try:
+        # create same random batches for both
+        batches = list()
+        for i in range(commit_num):
+            batch = dict()
+            for name in database_tuple:
+                batch[name] = [(os.urandom(32), os.urandom(value_size)) for dummy in range(records)]
+            batches.append(batch)
+        # old
+        os.mkdir(os.path.join(work_dir, 'old'))
+        dbs = {name: create_backend(os.path.join(work_dir, 'old', name), create_if_missing=True, name=backend)
+               for name in database_tuple}
+        spans = list()
+        io_before = _disk_write_bytes()
+        for batch in batches:
+            s = time()
+            for name, items in batch.items():
+                dbs[name].write(items, sync)
+            spans.append(time() - s)
+        old = _report('eight LevelDB', spans, _disk_write_bytes() - io_before)
+        for db in dbs.values():
+            db.close()
+        # new
+        db = create_backend(os.path.join(work_dir, 'new'), create_if_missing=True, name=backend)
+        spans = list()
+        io_before = _disk_write_bytes()
+        for batch in batches:
+            s = time()
+            db.write([(database_prefix[name] + k, v) for name, items in batch.items() for k, v in items], sync)
+            spans.append(time() - s)
+        new = _report('one LevelDB', spans, _disk_write_bytes() - io_before)
+        db.close()
+        return {'old': old, 'new': new}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def benchmark_write_coins(work_dir, count=10000, span=1000, commit_span=100, backend=None):
+    """
+    insert many mint updates of one coin_id
+    latency per insert should be flat (not depend on history length)
+    """
+    if os.path.exists(work_dir):
+        raise FileExistsError('Use new directory for benchmark. {}'.format(work_dir))
+    os.makedirs(work_dir)
+    db, original = _open_database(work_dir, backend)
+    try:
+        result = list()
+        spent = 0.0
+        db.batch_create()
+        for i in range(1, count+1):
+            s = time()
+            db.write_coins(coin_id=1, txhash=os.urandom(32), params={'address': 'dummy'}, setting=None)
+            spent += time() - s
+            if i % commit_span == 0:
+                db.batch_commit()
+                db.batch_create()
+            if i % span == 0:
+                result.append(round(spent / span * 1000000, 2))
+                logging.info("Benchmark write_coins {}~{} {}uSec/insert".format(i-span, i, result[-1]))
+                spent = 0.0
+        db.batch_commit()
+        return result  # [uSec/insert of each span,..]
+    finally:
+        _close_database(db, original)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def benchmark_multi_get(work_dir, sizes=(1000, 100000), backend=None):
+    """
+    compare point lookup one by one with read_usedindex_many
+    keys are random order like txhash
+    """
+    if os.path.exists(work_dir):
+        raise FileExistsError('Use new directory for benchmark. {}'.format(work_dir))
+    os.makedirs(work_dir)
+    db, original = _open_database(work_dir, backend)
+    try:
+        result = dict()
+        for size in sizes:
+            hashes = [os.urandom(32) for dummy in range(size)]
+            db.batch_create()
+            for txhash in hashes:
+                db.write_usedindex(txhash, {0, 1})
+            db.batch_commit()
+            db = _reopen_database(db)
+            s = time()
+            single = [db.read_usedindex(txhash) for txhash in hashes]
+            single_time = time() - s
+            db = _reopen_database(db)
+            s = time()
+            many = db.read_usedindex_many(hashes)
+            many_time = time() - s
+            assert single == many
+            result[size] = {
+                'single(uSec/item)': round(single_time / size * 1000000, 3),
+                'many(uSec/item)': round(many_time / size * 1000000, 3)}
+            logging.info("Benchmark multi get {} keys {}".format(size, result[size]))
+        return result
+    finally:
+        _close_database(db, original)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def benchmark_address_scan(work_dir, records=1000000, backend=None):
+    """
+    scan many "_address_index" records of one address
+    old: copy key and value before decode
+    new: read_address_idx_iter, decode by unpack_from without copy
+    """
+    if os.path.exists(work_dir):
+        raise FileExistsError('Use new directory for benchmark. {}'.format(work_dir))
+    os.makedirs(work_dir)
+    db, original = _open_database(work_dir, backend)
+    try:
+        address = 'N' + 'A' * 39
+        prefix = database_prefix['_address_index']
+        b_address = address.encode()
+        items = list()
+        for i in range(records):
+            k = struct_address.pack(b_address, os.urandom(32), i % 256)
+            items.append((prefix + k, struct_address_idx.pack(0, i, False)))
+            if len(items) >= 100000:
+                db._db.write(items)
+                items.clear()
+        db._db.write(items)
+        db = _reopen_database(db)
+        start = prefix + b_address + b'\x00' * 33
+        stop = prefix + b_address + b'\xff' * 33
+
+        def old_scan():
+            for k, v in db._db.iterator(start=start, stop=stop):
+                k, v = bytes(k[1:]), bytes(v)
+                yield struct_address.unpack(k) + struct_address_idx.unpack(v)
+
+        def new_scan():
+            return db.read_address_idx_iter(address)
+
+        result = dict()
+        for name, scan in (('old', old_scan), ('new', new_scan)):
+            s = time()
+            count = sum(1 for dummy in scan())
+            span = time() - s
+            assert count == records, (count, records)
+            tracemalloc.start()
+            for dummy in scan():
+                pass
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result[name] = {
+                'records': count,
+                'total(Sec)': round(span, 4),
+                'average(uSec)': round(span / count * 1000000, 4),
+                'peak(kb)': peak // 1024}
+            logging.info("Benchmark address scan {} {}".format(name, result[name]))
+        return result
+    finally:
+        _close_database(db, original)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+__all__ = [
+    "benchmark_db_commit",
+    "benchmark_write_coins",
+    "benchmark_multi_get",
+    "benchmark_address_scan",
+]
@@ -50,7 +50,7 @@ async def chain_info(request):
 async def chain_private_info(request):
     try:
         main_chain = [block.getinfo() for block in builder.best_chain]
-        orphan_chain = [block.getinfo() for block in builder.chain.values() if block not in builder.best_chain]
+        orphan_chain = [block.getinfo() for block in builder.chain.values() if builder.best_chain_index.get(block.height) != block.hash]
         data = {
             'main': main_chain,
             'orphan': sorted(orphan_chain, key=lambda x: x['height']),
@@ -92,6 +92,9 @@ async def system_private_info(request):
                 'threads': [str(s) for s in generating_threads]
             },
             'locked': is_locked_database(cur),
+            'database_cashe': builder.db.cashe.getinfo(),
+            'database_pending': len(builder.db.pending),
+            'mempool': tx_builder.unconfirmed.getinfo(),
             'access_time': int(time.time()),
             'start_time': start_time}
     return web_base.json_res(data)
@@ -1,3 +1,4 @@
+from bc4py.config import C, V
 from bc4py.user.api import web_base
 from bc4py.database.builder import builder, tx_builder
 from bc4py.database.mintcoin import get_mintcoin_object
@@ -23,6 +24,38 @@ async def get_block_by_height(request):
     return web_base.json_res(data)
 
 
+async def get_block_headers(request):
+    try:
+        start_height = int(request.query['height'])
+        count = min(500, int(request.query.get('count', 100)))
+        stop_height = start_height + count - 1
+        data = list()
+        with builder.db.read_view() as view:
+            # database
+            for height, blockhash, previous_hash, _time, bits, flag, work_hash in \
+                    builder.db.read_block_header_iter(start_height=start_height, stop_height=stop_height):
+                data.append(_header2info(height, blockhash, previous_hash, _time, bits, flag, work_hash))
+        # memory
+        for block in reversed(view.best_chain):
+            if start_height <= block.height <= stop_height:
+                data.append(_header2info(block.height, block.hash, block.previous_hash,
+                                         block.time, block.bits, block.flag, block.work_hash))
+        return web_base.json_res(data)
+    except Exception:
+        return web_base.error_res()
+
+
+def _header2info(height, blockhash, previous_hash, _time, bits, flag, work_hash):
+    return {
+        'height': height,
+        'hash': hexlify(blockhash).decode(),
+        'previous_hash': hexlify(previous_hash).decode(),
+        'time': V.BLOCK_GENESIS_TIME + _time,
+        'bits': bits,
+        'flag': C.consensus2name[flag],
+        'work_hash': hexlify(work_hash).decode() if work_hash else None}
+
+
 async def get_block_by_hash(request):
     try:
         f_pickled = request.query.get('pickle', False)
@@ -89,6 +122,7 @@ async def get_mintcoin_history(request):
 
 __all__ = [
     "get_block_by_height",
+    "get_block_headers",
     "get_block_by_hash",
     "get_tx_by_hash",
     "get_mintcoin_info",
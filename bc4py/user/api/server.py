@@ -117,6 +117,7 @@ def create_rest_server(f_local, port=3000, user=None, pwd=None, f_blocking=True,
     # BlockChain
     app.router.add_get('/public/getblockbyheight', get_block_by_height)
     app.router.add_get('/public/getblockbyhash', get_block_by_hash)
+    app.router.add_get('/public/getblockheaders', get_block_headers)
     app.router.add_get('/public/gettxbyhash', get_tx_by_hash)
     app.router.add_get('/public/getmintinfo', get_mintcoin_info)
     app.router.add_get('/public/getminthistory', get_mintcoin_history)
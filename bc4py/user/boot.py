@@ -1,13 +1,16 @@
-from bc4py.config import C, V
+from bc4py.config import C, V, P, BlockChainError
 from bc4py.chain.block import Block
 from bc4py.chain.tx import TX
 from bc4py.database.builder import builder, tx_builder
-from bc4py.chain.checking import new_insert_block
+from bc4py.chain.checking import new_insert_block, check_tx, check_tx_time
+from bc4py.chain.checking.signature import batch_sign_cashe
 import os
+import time
 import bjson
 import logging
 import pickle
 import random
+from threading import Thread
 from base64 import b64decode, b64encode
 
 
@@ -79,9 +82,55 @@ def load_bootstrap_file():
     logging.debug("load bootstrap.dat! last={}".format(block))
 
 
+def load_unconfirmed_file():
+    """ load unconfirmed txs saved on last clean shutdown, after booting mode finish """
+    def run():
+        # inputs of the txs may be on blocks not synced yet
+        while P.F_NOW_BOOTING:
+            if P.F_STOP:
+                return
+            time.sleep(1)
+        try:
+            _load_unconfirmed()
+        except Exception:
+            logging.error("Failed load unconfirmed file.", exc_info=True)
+
+    Thread(target=run, name='LoadUnconfirmed', daemon=True).start()
+
+
+def _load_unconfirmed():
+    limit = int(time.time() - V.BLOCK_GENESIS_TIME - C.ACCEPT_MARGIN_TIME)
+    txs = list()
+    expired = 0
+    for tx, first_seen in tx_builder.read_unconfirmed_iter(builder.db.dirs):
+        if limit > tx.deadline:
+            expired += 1
+        else:
+            txs.append((tx, first_seen))
+    try:
+        batch_sign_cashe([tx for tx, first_seen in txs])
+    except Exception:
+        logging.warning("Failed batch verify, verify signature one by one.", exc_info=True)
+    count = 0
+    for tx, first_seen in txs:
+        try:
+            check_tx_time(tx)
+            check_tx(tx, include_block=None)
+            tx_builder.put_unconfirmed(tx)
+            if tx.hash in tx_builder.unconfirmed:
+                tx_builder.unconfirmed.first_seen[tx.hash] = first_seen
+                count += 1
+        except BlockChainError as e:
+            logging.debug("Failed load unconfirmed {} by \"{}\"".format(tx, e))
+        except Exception:
+            logging.warning("Failed load unconfirmed {}".format(tx), exc_info=True)
+    logging.info("Load unconfirmed {}/{} txs, {} expired.".format(count, len(txs), expired))
+
+
 __all__ = [
     "create_boot_file",
     "load_boot_file",
     "create_bootstrap_file",
-    "load_bootstrap_file"
+    "load_bootstrap_file",
+    "load_unconfirmed_file",
 ]
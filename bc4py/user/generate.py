@@ -9,6 +9,7 @@ from bc4py.database.create import create_db, closing
 from bc4py.database.account import create_new_user_keypair
 from bc4py.database.tools import get_unspents_iter
 from bc4py.user.utils import message2signature
+from bc4py.user.template import block_template
 from threading import Thread, Event
 from time import time, sleep
 import logging
@@ -25,7 +26,6 @@ output_que = queue.LifoQueue()
 # mining share info
 mining_address = None
 previous_block = None
-unconfirmed_txs = None
 unspents_txs = None
 staking_limit = 500
 
@@ -97,7 +97,7 @@ class Generate(Thread):
         self.event_close.set()
         while self.event_close.is_set():
             # check start mining
-            if previous_block is None or unconfirmed_txs is None:
+            if not block_template.is_ready(previous_block):
                 sleep(0.1)
                 continue
             mining_block = create_mining_block(self.consensus)
@@ -105,7 +105,7 @@ class Generate(Thread):
             new_span = generate_many_hash(mining_block, how_many)
             spans_deque.append(new_span)
             # check block
-            if previous_block is None or unconfirmed_txs is None:
+            if not block_template.is_ready(previous_block):
                 logging.debug("Not confirmed new block by \"nothing params\"")
             elif previous_block.hash != mining_block.previous_hash:
                 logging.debug("Not confirmed new block by \"Don't match previous_hash\"")
@@ -136,7 +136,7 @@ class Generate(Thread):
         self.event_close.set()
         while self.event_close.is_set():
             # check start mining
-            if previous_block is None or unconfirmed_txs is None or unspents_txs is None:
+            if not block_template.is_ready(previous_block) or unspents_txs is None:
                 sleep(0.1)
                 continue
             if len(unspents_txs) == 0:
@@ -158,7 +158,7 @@ class Generate(Thread):
             staking_block.flag = C.BLOCK_POS
             staking_block.bits2target()
             staking_block.txs.append(None)  # Dummy proof tx
-            staking_block.txs.extend(unconfirmed_txs)
+            staking_block.txs.extend(block_template.get_txs())
             calculate_nam = 0
             for proof_tx in unspents_txs.copy():
                 address = proof_tx.outputs[0][0]
@@ -166,7 +166,7 @@ class Generate(Thread):
                 proof_tx.update_time()
                 calculate_nam += 1
                 # next check block
-                if previous_block is None or unconfirmed_txs is None or unspents_txs is None:
+                if not block_template.is_ready(previous_block) or unspents_txs is None:
                     logging.debug("Reset by \"nothing params found\"")
                     sleep(1)
                     break
@@ -208,6 +208,9 @@ def create_mining_block(consensus):
     global mining_address
     # create proof_tx
     mining_address = mining_address or V.MINING_ADDRESS or new_key()
+    if not block_template.is_ready(previous_block):
+        raise BlockChainError('Block template is not updated.')
+    unconfirmed_txs = block_template.get_txs()
     reward = GompertzCurve.calc_block_reward(previous_block.height + 1)
     fees = sum(tx.gas_amount * tx.gas_price for tx in unconfirmed_txs)
     proof_tx = TX(tx={
@@ -241,10 +244,9 @@ def create_mining_block(consensus):
 
 def confirmed_generating_block(new_block):
     logging.info("Generate block yey!! {}".format(new_block))
-    global mining_address, previous_block, unconfirmed_txs, unspents_txs
+    global mining_address, previous_block, unspents_txs
     mining_address = None
     previous_block = None
-    unconfirmed_txs = None
     unspents_txs = None
     output_que.put(new_block)
 
@@ -254,11 +256,6 @@ def update_previous_block(new_previous_block):
     previous_block = new_previous_block
 
 
-def update_unconfirmed_txs(new_unconfirmed_txs):
-    global unconfirmed_txs
-    unconfirmed_txs = new_unconfirmed_txs
-
-
 def update_unspents_txs():
     global unspents_txs
     c = 50
@@ -310,7 +307,6 @@ __all__ = [
     "create_mining_block",
     "confirmed_generating_block",
     "update_previous_block",
-    "update_unconfirmed_txs",
     "update_unspents_txs",
     "close_generate"
 ]
@@ -47,19 +47,22 @@ class BroadcastCmd:
         try:
             new_tx = TX(binary=data['tx'])
             new_tx.signature = data['sign']
+            if not tx_builder.unconfirmed.is_acceptable(new_tx):
+                raise BlockChainError('Too low gas_price {}<{}'
+                                      .format(new_tx.gas_price, tx_builder.unconfirmed.min_gas_price()))
             check_tx_time(new_tx)
             check_tx(tx=new_tx, include_block=None)
-            if new_tx.type in (C.TX_VALIDATOR_EDIT, C.TX_CONCLUDE_CONTRACT) and new_tx.hash in tx_builder.unconfirmed:
+            if new_tx.type in (C.TX_VALIDATOR_EDIT, C.TX_CONCLUDE_CONTRACT) and \
+                    tx_builder.unconfirmed.merge_signature(new_tx):
                 # marge contract signature
-                original_tx = tx_builder.unconfirmed[new_tx.hash]
-                new_signature = list(set(new_tx.signature) | set(original_tx.signature))
-                original_tx.signature = new_signature
                 logging.info("Marge contract tx {}".format(new_tx))
-            else:
+            elif tx_builder.put_unconfirmed(new_tx):
                 # normal tx
-                tx_builder.put_unconfirmed(new_tx)
                 update_mining_staking_all_info()
                 logging.info("Accept new tx {}".format(new_tx))
+            else:
+                raise BlockChainError('Not accepted to unconfirmed, evicted by low gas_price {}'
+                                      .format(new_tx.gas_price))
             return True
         except BlockChainError as e:
             error = 'Failed accept new tx "{}"'.format(e)
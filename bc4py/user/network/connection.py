@@ -8,6 +8,7 @@ from time import sleep
 
 good_node = list()
 bad_node = list()
+pruned_node = dict()  # {user: pruned_height,..}
 best_hash_on_network = None
 best_height_on_network = None
 
@@ -29,6 +30,7 @@ def set_good_node():
         if r['booting'] is False:
             f_all_booting = False
         node.append((user, r['hash'], r['height'], r['booting']))
+        pruned_node[user] = r.get('pruned_height', 0)
     global best_hash_on_network, best_height_on_network
     # get best height and best hash
     (best_height, best_hash), count = status_counter.most_common()[0]
@@ -45,6 +47,12 @@ def set_good_node():
             bad_node.append(user)
 
 
+def is_pruned_node(user, cmd, data):
+    if cmd != DirectCmd.BIG_BLOCKS:
+        return False
+    return 0 < data['height'] <= pruned_node.get(user, 0)
+
+
 def reset_good_node():
     good_node.clear()
     global best_hash_on_network, best_height_on_network
@@ -65,7 +73,9 @@ def ask_node(cmd, data=None, f_continue_asking=False):
             if len(good_node) == 0:
                 set_good_node()
             user = user_list.pop()
-            if user in good_node:
+            if is_pruned_node(user, cmd, data):
+                pass  # do not have block bodies
+            elif user in good_node:
                 dummy, r = pc.send_direct_cmd(cmd=cmd, data=data, user=user)
                 if isinstance(r, str):
                     failed += 1
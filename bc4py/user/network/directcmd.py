@@ -13,6 +13,7 @@ def _best_info():
             'flag': builder.best_block.flag,
             'difficulty': builder.best_block.difficulty,
             'txs': txs,
+            'pruned_height': builder.pruned_height,
             'booting': P.F_NOW_BOOTING}
     else:
         return {
@@ -22,6 +23,7 @@ def _best_info():
             'flag': None,
             'difficulty': None,
             'txs': [],
+            'pruned_height': builder.pruned_height,
             'booting': True}
 
 
@@ -37,6 +39,8 @@ def _block_by_hash(blockhash):
     block = builder.get_block(blockhash)
     if block is None:
         return 'Not found blockhash {}.'.format(hexlify(blockhash).decode())
+    elif block.height <= builder.pruned_height and block.height != 0:
+        return 'Pruned block height {}, have bodies from {}.'.format(block.height, builder.pruned_height+1)
     txs = [{
         'tx': tx.b,
         'sign': tx.signature}
@@ -72,6 +76,9 @@ def _unconfirmed_tx():
 
 
 def _big_blocks(height):
+    if 0 < height <= builder.pruned_height:
+        # do not ask us for removed bodies
+        return 'Pruned block height {}, have bodies from {}.'.format(height, builder.pruned_height+1)
     data = list()
     for i in range(20):
         blockhash = builder.get_block_hash(height + i)
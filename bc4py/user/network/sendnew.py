@@ -59,6 +59,9 @@ def mined_newblock(que, pc):
 def send_newtx(new_tx, outer_cur=None, exc_info=True):
     assert V.PC_OBJ, "PeerClient is None."
     try:
+        if not tx_builder.unconfirmed.is_acceptable(new_tx):
+            raise BlockChainError('Too low gas_price {}<{}'
+                                  .format(new_tx.gas_price, tx_builder.unconfirmed.min_gas_price()))
         check_tx_time(new_tx)
         check_tx(new_tx, include_block=None)
         data = {
@@ -66,17 +69,24 @@ def send_newtx(new_tx, outer_cur=None, exc_info=True):
             'data': {
                 'tx': new_tx.b,
                 'sign': new_tx.signature}}
-        V.PC_OBJ.send_command(cmd=ClientCmd.BROADCAST, data=data)
-        if new_tx.type in (C.TX_VALIDATOR_EDIT, C.TX_CONCLUDE_CONTRACT)and new_tx.hash in tx_builder.unconfirmed:
+        if new_tx.type in (C.TX_VALIDATOR_EDIT, C.TX_CONCLUDE_CONTRACT) and \
+                tx_builder.unconfirmed.merge_signature(new_tx):
             # marge contract signature
-            original_tx = tx_builder.unconfirmed[new_tx.hash]
-            new_signature = list(set(new_tx.signature) | set(original_tx.signature))
-            original_tx.signature = new_signature
             logging.info("Marge contract tx {}".format(new_tx))
-        else:
-            # normal tx
-            tx_builder.put_unconfirmed(new_tx, outer_cur)
-            logging.info("Success broadcast new tx {}".format(new_tx))
+            V.PC_OBJ.send_command(cmd=ClientCmd.BROADCAST, data=data)
+            return True
+        # normal tx
+        f_known = new_tx.hash in tx_builder.unconfirmed
+        if not tx_builder.put_unconfirmed(new_tx, outer_cur):
+            raise BlockChainError('Not accepted to unconfirmed, evicted by low gas_price {}'
+                                  .format(new_tx.gas_price))
+        try:
+            V.PC_OBJ.send_command(cmd=ClientCmd.BROADCAST, data=data)
+        except Exception:
+            if not f_known:
+                tx_builder.remove_unconfirmed(new_tx.hash)
+            raise
+        logging.info("Success broadcast new tx {}".format(new_tx))
         return True
     except Exception as e:
         logging.warning("Failed broadcast new tx, other nodes don\'t accept {}"
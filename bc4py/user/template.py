@@ -0,0 +1,273 @@
+from bc4py.config import C, Debug
+from bc4py.database.builder import builder, tx_builder
+from bc4py.database.validator import get_validator_object
+from bc4py.database.contract import start_tx2index
+from bc4py.chain.checking.signature import get_signed_cks
+from bc4py.chain.checking.utils import sticky_failed_txhash
+from bisect import bisect_left, insort
+from collections import defaultdict, deque
+import threading
+import logging
+import bjson
+
+
+def _fee_key(tx):
+    # high gas_price first, old first on same gas_price
+    return -tx.gas_price, tx.time, tx.hash
+
+
+class BlockTemplate:
+    """
+    ready to mine unconfirmed txs, updated by difference of unconfirmed txs and best chain
+    txs: {txhash: tx} included txs
+    pending: {txhash: tx} not includable now, checked again on new block
+    rejected: {txhash,..} never includable on this chain, cleared on reorg
+    lost: {txhash: {txhash,..}} pending txs lost by conflict, checked again when winner is excluded
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.best_hash = None
+        self.txs = dict()
+        self.pending = dict()
+        self.rejected = set()
+        self.fee_order = list()  # [(-gas_price, time, txhash),..] of included txs
+        self.outpoints = dict()  # (txhash, txindex): included txhash
+        self.messages = dict()  # txhash: decoded contract message
+        self.conclude = dict()  # txhash: (c_address, start_tx index)
+        self.lost = dict()  # loser txhash: {winner txhash,..}
+        self.chain_used = set()  # outpoints used by blocks on memory
+        self.chain_used_blocks = deque()  # [(height, {outpoint,..}),..] old first
+        self.ordered = None
+
+    def is_ready(self, previous_block):
+        return previous_block is not None and previous_block.hash == self.best_hash
+
+    def get_txs(self):
+        # [tx,..] ordered to include to block
+        with self.lock:
+            if self.ordered is None:
+                self.ordered = self._ordering()
+            txs = self.ordered
+        if Debug.F_STICKY_TX_REJECTION:
+            txs = [tx for tx in txs if tx.hash not in sticky_failed_txhash]
+        if Debug.F_LIMIT_INCLUDE_TX_IN_BLOCK:
+            txs = txs[:Debug.F_LIMIT_INCLUDE_TX_IN_BLOCK]
+        return txs
+
+    def update(self):
+        with self.lock:
+            best_block, best_chain = builder.get_best_chain()
+            connected = self._connected_blocks(best_block, best_chain)
+            if connected is None:
+                logging.debug("Reset block template by reorg.")
+                self._reset()
+                for block in reversed(best_chain):
+                    self._add_chain_used(block)
+            recheck = connected is None or len(connected) > 0
+            self.best_hash = best_block.hash
+            for block in connected or ():
+                self._affect_block(block)
+                self._add_chain_used(block)
+            # blocks moved to database are checked by usedindex, root is dummy before first batch
+            root_height = builder.root_block.height
+            while len(self.chain_used_blocks) > 0 and root_height is not None and \
+                    self.chain_used_blocks[0][0] <= root_height:
+                height, outpoints = self.chain_used_blocks.popleft()
+                self.chain_used -= outpoints
+            # difference of unconfirmed txs
+            with tx_builder.unconfirmed.lock:
+                unconfirmed = dict(tx_builder.unconfirmed)
+            for txhash in self.txs.keys() - unconfirmed.keys():
+                self._exclude(txhash)
+            for txhash in self.pending.keys() - unconfirmed.keys():
+                del self.pending[txhash]
+            self.rejected &= unconfirmed.keys()
+            for txhash in self.messages.keys() - unconfirmed.keys():
+                del self.messages[txhash]
+            for txhash in self.conclude.keys() - self.txs.keys() - self.pending.keys():
+                del self.conclude[txhash]
+            check_txs = {txhash: tx for txhash, tx in unconfirmed.items()
+                         if txhash not in self.txs and txhash not in self.pending and txhash not in self.rejected}
+            # contract txs depend on validators and signatures merged later
+            check_txs.update((tx.hash, tx) for tx in self.txs.values()
+                             if tx.type in (C.TX_CONCLUDE_CONTRACT, C.TX_VALIDATOR_EDIT))
+            if recheck:
+                check_txs.update(self.pending)
+            else:
+                check_txs.update((tx.hash, tx) for tx in self.pending.values()
+                                 if tx.type in (C.TX_CONCLUDE_CONTRACT, C.TX_VALIDATOR_EDIT))
+            # winner of conflict is excluded
+            for txhash, winners in list(self.lost.items()):
+                if txhash not in self.pending:
+                    del self.lost[txhash]
+                elif not winners <= self.txs.keys():
+                    del self.lost[txhash]
+                    check_txs[txhash] = self.pending[txhash]
+            self._check_txs(sorted(check_txs.values(), key=_fee_key), best_block, best_chain)
+        return len(self.txs), len(unconfirmed)
+
+    def _connected_blocks(self, best_block, best_chain):
+        # blocks connected after last update, None if reorg
+        if self.best_hash == best_block.hash:
+            return list()
+        for i, block in enumerate(best_chain):
+            if block.hash == self.best_hash:
+                return list(reversed(best_chain[:i]))
+        if builder.root_block.hash == self.best_hash:
+            return list(reversed(best_chain))
+        return None
+
+    def _reset(self):
+        self.txs.clear()
+        self.pending.clear()
+        self.rejected.clear()
+        self.fee_order.clear()
+        self.outpoints.clear()
+        self.conclude.clear()
+        self.lost.clear()
+        self.chain_used.clear()
+        self.chain_used_blocks.clear()
+        self.ordered = None
+
+    def _add_chain_used(self, block):
+        outpoints = {pair for tx in block.txs for pair in tx.inputs}
+        self.chain_used_blocks.append((block.height, outpoints))
+        self.chain_used.update(outpoints)
+
+    def _affect_block(self, block):
+        for tx in block.txs:
+            if tx.hash in self.txs:
+                self._exclude(tx.hash)
+            self.pending.pop(tx.hash, None)
+            for pair in tx.inputs:
+                # spent by chain
+                txhash = self.outpoints.get(pair)
+                if txhash is not None and txhash != tx.hash:
+                    self._exclude(txhash)
+                    self.rejected.add(txhash)
+
+    def _include(self, tx):
+        self.pending.pop(tx.hash, None)
+        self.txs[tx.hash] = tx
+        insort(self.fee_order, _fee_key(tx))
+        for pair in tx.inputs:
+            self.outpoints[pair] = tx.hash
+        self.ordered = None
+
+    def _exclude(self, txhash):
+        tx = self.txs.pop(txhash)
+        del self.fee_order[bisect_left(self.fee_order, _fee_key(tx))]
+        for pair in tx.inputs:
+            if self.outpoints.get(pair) == txhash:
+                del self.outpoints[pair]
+        self.conclude.pop(txhash, None)
+        self.ordered = None
+        return tx
+
+    def _check_txs(self, txs, best_block, best_chain):
+        validators = dict()
+        limit_height = best_block.height - C.MATURE_HEIGHT
+        for tx in txs:
+            if tx.hash in self.rejected:
+                continue
+            result = self._check_tx(tx, limit_height, validators, best_block, best_chain)
+            if result is None:
+                if tx.hash in self.txs:
+                    self._exclude(tx.hash)
+                self.pending.pop(tx.hash, None)
+                self.rejected.add(tx.hash)
+                continue
+            elif result is False:
+                if tx.hash in self.txs:
+                    self._exclude(tx.hash)
+                self.pending[tx.hash] = tx
+                continue
+            elif tx.hash in self.txs:
+                continue
+            # check inputs used same unconfirmed_txs, high fee tx is included
+            conflicts = {self.outpoints[pair] for pair in tx.inputs if pair in self.outpoints}
+            if any(_fee_key(self.txs[txhash]) < _fee_key(tx) for txhash in conflicts):
+                self.pending[tx.hash] = tx
+                self.lost[tx.hash] = conflicts
+                continue
+            for txhash in conflicts:
+                self.pending[txhash] = self._exclude(txhash)
+                self.lost[txhash] = {tx.hash}
+            self._include(tx)
+
+    def _check_tx(self, tx, limit_height, validators, best_block, best_chain):
+        # True: include, False: pending, None: reject
+        if tx.height is not None:
+            return False  # removed from unconfirmed soon
+        if len(set(tx.inputs)) != len(tx.inputs):
+            return None
+        # inputs check
+        for txhash, txindex in tx.inputs:
+            input_tx = tx_builder.get_tx(txhash)
+            if input_tx is None:
+                return False
+            elif input_tx.height is None:
+                return False
+            elif input_tx.type in (C.TX_POS_REWARD, C.TX_POW_REWARD) and \
+                    input_tx.height > limit_height:
+                return False
+            elif (txhash, txindex) in self.chain_used or txindex in builder.db.read_usedindex(txhash):
+                return None
+        # contract tx
+        if tx.type not in (C.TX_CONCLUDE_CONTRACT, C.TX_VALIDATOR_EDIT):
+            return True
+        if tx.hash not in self.messages:
+            try:
+                self.messages[tx.hash] = bjson.loads(tx.message)
+            except Exception:
+                return None  # failed decode bjson
+        if tx.type == C.TX_CONCLUDE_CONTRACT:
+            c_address, start_hash, c_storage = self.messages[tx.hash]
+        else:
+            c_address, address, flag, sig_diff = self.messages[tx.hash]
+        if c_address not in validators:
+            validators[c_address] = get_validator_object(
+                c_address=c_address, best_block=best_block, best_chain=best_chain)
+        v = validators[c_address]
+        accept_cks = get_signed_cks(tx) & set(v.validators)
+        if v.require > len(accept_cks):
+            return False
+        if tx.type == C.TX_CONCLUDE_CONTRACT:
+            start_tx = tx_builder.get_tx(txhash=start_hash)
+            if start_tx is None or start_tx.height is None:
+                return False
+            # decide to include the ConcludeTx
+            conclude = (c_address, start_tx2index(start_tx=start_tx))
+            if self.conclude.get(tx.hash) != conclude:
+                self.conclude[tx.hash] = conclude
+                self.ordered = None
+        return True
+
+    def _ordering(self):
+        txs = [self.txs[txhash] for dummy, dummy, txhash in self.fee_order]
+        # affect resort txs (for contract)
+        need_resort_txs = defaultdict(list)
+        for txhash, (c_address, index) in self.conclude.items():
+            if txhash not in self.txs:
+                continue
+            need_resort_txs[c_address].append((index, self.txs[txhash]))
+        append_txs = list()
+        for c_address, data_list in need_resort_txs.items():
+            if len(data_list) < 2:
+                continue
+            for index, tx in sorted(data_list, key=lambda x: x[0]):
+                append_txs.append(tx)
+        if len(append_txs) > 0:
+            resort = {tx.hash for tx in append_txs}
+            txs = [tx for tx in txs if tx.hash not in resort] + append_txs
+        return txs
+
+
+block_template = BlockTemplate()
+
+
+__all__ = [
+    "BlockTemplate",
+    "block_template",
+]
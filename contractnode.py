@@ -18,6 +18,7 @@ from p2p_python.client import PeerClient
 from bc4py.for_debug import set_logger
 from threading import Thread
 import logging
+import sys
 
 
 def work(port, sub_dir=None):
@@ -53,8 +54,9 @@ def work(port, sub_dir=None):
     pc.broadcast_check = broadcast_check
 
     # Update to newest blockchain
-    builder.init(genesis_block, batch_size=500)
-    builder.db.sync = False  # more fast but unstable
+    builder.init(genesis_block, batch_size=500, full_verify='--full-verify' in sys.argv)
+    load_unconfirmed_file()
+    # builder.db.sync = False  # more fast but unstable
     sync_chain_loop()
 
     # Mining/Staking setup
@@ -19,6 +19,7 @@ from p2p_python.client import PeerClient
 from bc4py.for_debug import set_logger, f_already_bind
 from threading import Thread
 import logging
+import sys
 import os
 
 
@@ -70,7 +71,8 @@ def work(port, sub_dir):
     pc.broadcast_check = broadcast_check
 
     # Update to newest blockchain
-    builder.init(genesis_block, batch_size=500)
+    builder.init(genesis_block, batch_size=500, full_verify='--full-verify' in sys.argv)
+    load_unconfirmed_file()
     # builder.db.sync = False  # more fast
     sync_chain_loop()
 
@@ -14,6 +14,7 @@ from p2p_python.utils import setup_p2p_params
 from p2p_python.client import PeerClient
 from bc4py.for_debug import set_logger
 import logging
+import sys
 
 
 def work(port, sub_dir=None):
@@ -49,8 +50,9 @@ def work(port, sub_dir=None):
     pc.broadcast_check = broadcast_check
 
     # Update to newest blockchain
-    builder.init(genesis_block, batch_size=500)
-    builder.db.sync = False  # more fast
+    builder.init(genesis_block, batch_size=500, full_verify='--full-verify' in sys.argv)
+    load_unconfirmed_file()
+    # builder.db.sync = False  # more fast
     sync_chain_loop()
 
     # Mining/Staking setup (nothing)